@@ -1,9 +1,30 @@
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings
 
 
 class DatabaseSettings(BaseSettings):
     MONGO_URL: str
     REDIS_URL: str
+    # Commands slower than this are logged with the shape of their filter
+    MONGO_SLOW_COMMAND_MS: float = 100
+    # Requests running more commands than this are logged, usually a query in a loop
+    MONGO_REQUEST_COMMANDS_WARNING: int = 20
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGO_CONNECT_TIMEOUT_MS: int = 20000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGO_SOCKET_TIMEOUT_MS: Optional[int] = None
+    # Comma separated, e.g. "zstd,zlib". zstd and snappy need their python packages.
+    MONGO_COMPRESSORS: str = ""
+    # Leaderboard, mentions and activity history are read from here, defaults to MONGO_URL
+    MONGO_READ_URL: Optional[str] = None
+    MONGO_READ_PREFERENCE: Literal[
+        "primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"
+    ] = "secondaryPreferred"
+    # Replicas further behind than this are not read from, 90 is the lowest MongoDB allows
+    MONGO_READ_MAX_STALENESS: int = 90
 
 
 class APISettings(BaseSettings):
@@ -11,15 +32,103 @@ class APISettings(BaseSettings):
     OSU_CLIENT_SECRET: str
     OSU_REDIRECT_URI: str
     POST_LOGIN_REDIRECT_URI: str
+    # Point this to app/test/fake_osu_api.py to run without network access
+    OSU_BASE_URL: str = "https://osu.ppy.sh"
+    OSU_API_TIMEOUT: float = 10
+    # Consecutive upstream failures before we stop calling osu! for a while
+    OSU_API_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    OSU_API_CIRCUIT_RECOVERY_TIME: float = 30
 
 
 class AuthSettings(BaseSettings):
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
+    # Number of verified tokens kept in memory to skip signature checks
+    JWT_CACHE_SIZE: int = 10000
+    # Lifetime of a login, osu! tokens are refreshed within it
+    SESSION_TTL: int = 30 * 24 * 60 * 60
+    # How long a worker trusts a session it read from redis
+    SESSION_LOCAL_TTL: int = 30
+    # osu! user ids allowed to use the debug endpoints
+    ADMIN_USER_IDS: list[int] = []
 
 
 class SentrySettings(BaseSettings):
     SENTRY_DSN: str
+    # Share of fast and successful requests that are traced, slow and failed ones are always kept
+    SENTRY_TRACES_SAMPLE_RATE: float = 0.05
+    SENTRY_SLOW_REQUEST_SECONDS: float = 1
+    # Share of kept traces that are also profiled
+    SENTRY_PROFILES_SAMPLE_RATE: float = 0
+
+
+class CacheSettings(BaseSettings):
+    # In-process tier in front of Redis, keeps the hottest keys off the network.
+    CACHE_LOCAL_MAX_BYTES: int = 32 * 1024 * 1024
+    CACHE_LOCAL_TTL: int = 30
+    # Cached bodies are stored gzipped and sent as-is to clients accepting gzip.
+    CACHE_GZIP_RESPONSES: bool = True
+    # Smaller bodies are stored as they are, gzip only adds overhead to them.
+    CACHE_GZIP_MIN_BYTES: int = 1024
+    # Expired entries are kept this long to be served when the upstream is down.
+    CACHE_STALE_TTL: int = 24 * 60 * 60
+    # Invalidated tags are dropped again after this many seconds,
+    # responses of requests that were running during the write are cached by then.
+    CACHE_TAG_REINVALIDATE_DELAY: float = 10
+    # Hot responses are computed in the background on startup, so the first visitors don't pay for them.
+    CACHE_WARMUP_ENABLED: bool = True
+    CACHE_WARMUP_CONCURRENCY: int = 4
+    # Leaderboard query strings that are always warmed, "" is the default leaderboard
+    CACHE_WARMUP_LEADERBOARDS: list[str] = [""]
+    # Most requested leaderboard variants warmed on top of the list above
+    CACHE_WARMUP_LEADERBOARD_COUNT: int = 10
+    # Profiles that are always warmed
+    CACHE_WARMUP_USER_IDS: list[int] = []
+    # Most visited and top leaderboard profiles warmed on top of the list above
+    CACHE_WARMUP_PROFILE_COUNT: int = 50
+
+
+class ActivitySettings(BaseSettings):
+    # Latest activities kept in memory and sent to new websocket clients
+    ACTIVITY_QUEUE_SIZE: int = 50
+    # Messages waiting for a websocket client before it is dropped as too slow
+    ACTIVITY_SEND_QUEUE_SIZE: int = 100
+    ACTIVITY_SEND_TIMEOUT: float = 10
+    ACTIVITY_HEARTBEAT_INTERVAL: float = 30
+    # Duplicate activities of a user are dropped on every worker for this many seconds, with redis
+    ACTIVITY_SPAM_TTL: int = 10 * 60
+    # Activities are saved to the database in batches from a background task
+    ACTIVITY_WRITE_BATCH_SIZE: int = 100
+    ACTIVITY_WRITE_FLUSH_INTERVAL: float = 1
+    ACTIVITY_WRITE_BUFFER_SIZE: int = 10000
+    # Size of the capped activity collection, older activities are dropped
+    ACTIVITY_COLLECTION_MAX_BYTES: int = 256 * 1024 * 1024
+    # Startup fails while the collection isn't capped. Set for one deploy to convert it,
+    # older activities beyond the size are dropped and the collection is locked meanwhile.
+    ACTIVITY_CONVERT_TO_CAPPED: bool = False
+    # Where workers get each other's activities from, "redis" pub/sub or tailing the "mongo" collection
+    ACTIVITY_FEED_SOURCE: Literal["redis", "mongo"] = "redis"
+
+
+class ProfilingSettings(BaseSettings):
+    # Traces allocations from startup, it slows down every allocation. Can also be started from /debug.
+    PROFILING_TRACEMALLOC: bool = False
+    PROFILING_TRACEMALLOC_FRAMES: int = 1
+    # Admins can profile a request with the X-Profile header while this is on, can be toggled from /debug
+    PROFILING_REQUESTS: bool = False
+    # Request profiles kept in memory for download
+    PROFILING_REQUEST_HISTORY: int = 20
+    PROFILING_CPU_SAMPLE_INTERVAL: float = 0.005
+    PROFILING_CPU_MAX_SECONDS: float = 60
+
+
+class RateLimitSettings(BaseSettings):
+    # Writes per user, kept in redis so every worker shares the limit
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PROFILE_BURST: int = 10
+    RATE_LIMIT_PROFILE_PER_MINUTE: float = 30
+    RATE_LIMIT_INFLUENCE_BURST: int = 10
+    RATE_LIMIT_INFLUENCE_PER_MINUTE: float = 20
 
 
 class TestSettings(BaseSettings):
@@ -27,7 +136,15 @@ class TestSettings(BaseSettings):
 
 
 class Settings(
-    DatabaseSettings, APISettings, AuthSettings, SentrySettings, TestSettings
+    DatabaseSettings,
+    APISettings,
+    AuthSettings,
+    SentrySettings,
+    CacheSettings,
+    ActivitySettings,
+    ProfilingSettings,
+    RateLimitSettings,
+    TestSettings,
 ):
     pass
 
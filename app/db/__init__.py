@@ -3,6 +3,9 @@ import logging
 from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel
+from pymongo.read_preferences import _ServerMode
+
+from app.utils.cache import invalidate_tags, invalidate_tags_later
 
 logger = logging.getLogger(__name__)
 
@@ -35,10 +38,44 @@ class User(BaseModel):
 
 
 class BaseAsyncMongoClient(AsyncIOMotorClient):
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        read_url: Optional[str] = None,
+        read_preference: Optional[_ServerMode] = None,
+        read_staleness: Optional[float] = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.main_db = self.get_database("MAPPER_INFLUENCES")
         self.users_collection = self.main_db.get_collection("Users")
         self.influences_collection = self.main_db.get_collection("Influences")
         self.real_users_collection = self.main_db.get_collection("RealUsers")
         self.activity_collection = self.main_db.get_collection("Activity")
+
+        # Heavy reads that can be a little behind go to replicas,
+        # writes and reads that must see them use the collections above.
+        self.read_client = (
+            AsyncIOMotorClient(read_url, **kwargs) if read_url is not None else None
+        )
+        read_db = (self.read_client or self).get_database("MAPPER_INFLUENCES")
+        if read_preference is not None:
+            read_db = read_db.with_options(read_preference=read_preference)
+        self.influences_read_collection = read_db.get_collection("Influences")
+        self.activity_read_collection = read_db.get_collection("Activity")
+        # How far behind the read collections can be
+        self.read_staleness = read_staleness
+
+    def close(self):
+        if self.read_client is not None:
+            self.read_client.close()
+        super().close()
+
+    async def invalidate_read_tags(self, *tags: str):
+        """
+        For cache entries built from the read collections. A replica that hasn't seen the write yet
+        can cache the old data again, so the tags are invalidated once more after it caught up.
+        """
+        await invalidate_tags(*tags)
+        if self.read_staleness is not None:
+            invalidate_tags_later(self.read_staleness, *tags)
@@ -1,21 +1,119 @@
 import logging
+from typing import Optional
+
+import pymongo
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure
+
 from app.db import BaseAsyncMongoClient
 
 logger = logging.getLogger(__name__)
 
+NAMESPACE_EXISTS = 48
+
+ACTIVITY_PROJECTION = {
+    "_id": 1,
+    "seq": 1,
+    "type": 1,
+    "user": 1,
+    "datetime": 1,
+    "details": 1,
+}
+
+
+def activity_from_document(document: dict) -> dict:
+    document["id"] = str(document.pop("_id"))
+    return document
+
 
 class ActivityMongoClient(BaseAsyncMongoClient):
-    async def save_activity(self, activity):
-        logger.debug(
-            f"Adding activity to database: {activity["user"]["id"]}-{activity["user"]["username"]}-{activity["type"]}"
+    async def setup_activity_collection(self, max_bytes: int, convert: bool = False):
+        """
+        Activities are kept in a capped collection, the oldest ones are dropped once it's full.
+        Its insertion order also lets the feed tail it like a log.
+        Every worker runs this on startup, so it is fine if another one does it at the same time.
+
+        An existing uncapped collection is only converted with `convert`, converting drops the
+        activities beyond `max_bytes` and locks the collection while it runs.
+        """
+        name = self.activity_collection.name
+        try:
+            await self.main_db.create_collection(name, capped=True, size=max_bytes)
+        except CollectionInvalid:
+            # Already exists
+            pass
+        except OperationFailure as ex:
+            # Another worker created it after our existence check
+            if ex.code != NAMESPACE_EXISTS:
+                raise
+
+        if not await self.is_activity_collection_capped():
+            if not convert:
+                raise RuntimeError(
+                    f"{name} is not a capped collection, set ACTIVITY_CONVERT_TO_CAPPED=true "
+                    f"for one deploy to convert it to {max_bytes} bytes"
+                )
+            logger.warning(
+                f"Converting {name} to a capped collection of {max_bytes} bytes"
+            )
+            try:
+                # Drops the secondary indexes, they are created again below
+                await self.main_db.command("convertToCapped", name, size=max_bytes)
+            except OperationFailure:
+                # Fine if another worker converted it meanwhile
+                if not await self.is_activity_collection_capped():
+                    raise
+
+        await self.activity_collection.create_index(
+            [("user.id", pymongo.ASCENDING), ("_id", pymongo.DESCENDING)]
         )
-        await self.activity_collection.insert_one(activity)
+
+    async def is_activity_collection_capped(self) -> bool:
+        return bool((await self.activity_collection.options()).get("capped"))
+
+    async def save_activities(self, activities: list[dict]):
+        logger.debug(f"Adding {len(activities)} activities to database")
+        await self.activity_collection.insert_many(activities, ordered=False)
 
     async def get_latest_activities(self, length):
-        data = (
-            await self.activity_collection.find({}, {"_id": 0})
-            .sort("_id", -1)
+        """Newest first, in insertion order, which the capped collection keeps without an index."""
+        documents = (
+            await self.activity_collection.find({}, ACTIVITY_PROJECTION)
+            .sort("$natural", pymongo.DESCENDING)
             .limit(length)
             .to_list(length=length)
         )
-        return data
+        return [activity_from_document(document) for document in documents]
+
+    async def tail_activities(self, overlap: int):
+        """
+        Cursor following the capped collection in insertion order, from the latest `overlap` activities on.
+        It waits for new activities instead of ending, and only dies when the collection is empty
+        or it fell behind the capped collection.
+        """
+        count = await self.activity_collection.estimated_document_count()
+        return self.activity_collection.find(
+            {},
+            ACTIVITY_PROJECTION,
+            cursor_type=CursorType.TAILABLE_AWAIT,
+            skip=max(count - overlap, 0),
+        )
+
+    async def get_activities(
+        self, before: Optional[str], limit: int, user_id: Optional[int] = None
+    ):
+        """Newest first, `before` is the id of the last activity of the previous page."""
+        query = {}
+        if before is not None:
+            query["_id"] = {"$lt": ObjectId(before)}
+        if user_id is not None:
+            query["user.id"] = user_id
+
+        documents = (
+            await self.activity_read_collection.find(query, ACTIVITY_PROJECTION)
+            .sort("_id", pymongo.DESCENDING)
+            .limit(limit)
+            .to_list(length=limit)
+        )
+        return [activity_from_document(document) for document in documents]
@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+import logging
+from collections import deque
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from app.config import settings
+from app.db.instance import get_mongo_db
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class ActivityWriter:
+    """
+    Write-behind buffer for activities.
+    Activities are saved with insert_many from a background task, either when a batch is full
+    or every flush interval, so request handlers never wait on the insert.
+    """
+
+    _instance = None
+    _lock = asyncio.Lock()
+
+    MAX_RETRIES = 5
+
+    @classmethod
+    async def get_instance(cls):
+        """To be able to use asyncio lock"""
+        if cls._instance is None:
+            async with cls._lock:
+                if cls._instance is None:  # Double-check locking
+                    cls._instance = ActivityWriter()
+                    cls._instance.buffer = deque()
+                    cls._instance.batch_size = settings.ACTIVITY_WRITE_BATCH_SIZE
+                    cls._instance.max_buffer = settings.ACTIVITY_WRITE_BUFFER_SIZE
+                    cls._instance.flush_interval = (
+                        settings.ACTIVITY_WRITE_FLUSH_INTERVAL
+                    )
+                    cls._instance.batch_ready = asyncio.Event()
+                    cls._instance.stopping = False
+                    # Usually first called from a request, a fresh context keeps its
+                    # request_commands, so the writes are counted as background work
+                    cls._instance.flush_task = asyncio.create_task(
+                        cls._instance.run(), context=contextvars.Context()
+                    )
+        return cls._instance
+
+    @classmethod
+    async def close_instance(cls):
+        """Flushes everything that is still buffered."""
+        if cls._instance is not None:
+            await cls._instance.close()
+            cls._instance = None
+
+    def add(self, activity: dict):
+        if len(self.buffer) >= self.max_buffer:
+            # Database is too far behind, losing the oldest activity beats running out of memory
+            self.buffer.popleft()
+            logger.warning("Activity write buffer is full, dropped oldest activity")
+
+        # Ids are assigned when the activity is created, so a retried batch can't insert duplicates.
+        # Copy, because the activity is also in the websocket queue.
+        document = {key: value for key, value in activity.items() if key != "id"}
+        document["_id"] = ObjectId(activity["id"])
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size:
+            self.batch_ready.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.batch_ready.wait(), timeout=self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self.batch_ready.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # The batch is back in the buffer, keep the task alive for the next flush
+                logger.error(
+                    "Could not save activities, will retry later", exc_info=True
+                )
+            if self.stopping:
+                return
+
+    async def flush(self):
+        while self.buffer:
+            batch = [
+                self.buffer.popleft()
+                for _ in range(min(self.batch_size, len(self.buffer)))
+            ]
+            try:
+                written = await self.write_batch(batch)
+            except Exception:
+                self.buffer.extendleft(reversed(batch))
+                raise
+            if not written:
+                # Put it back to try again on the next flush
+                self.buffer.extendleft(reversed(batch))
+                return
+
+    async def write_batch(self, batch: list[dict]) -> bool:
+        mongo_db = get_mongo_db()
+        for attempt in range(self.MAX_RETRIES):
+            try:
+                await mongo_db.save_activities(batch)
+                return True
+            except BulkWriteError as ex:
+                write_errors = ex.details.get("writeErrors", [])
+                if all(err["code"] == DUPLICATE_KEY_ERROR for err in write_errors):
+                    # Inserted by an earlier attempt that we didn't get the answer of
+                    return True
+                # Retrying won't fix invalid documents, drop them
+                logger.error(f"Could not save activities: {ex.details}")
+                return True
+            except ConnectionFailure:
+                logger.warning(
+                    f"Saving activities failed (attempt {attempt + 1}), retrying",
+                    exc_info=True,
+                )
+                await asyncio.sleep(2**attempt * 0.1)
+        logger.error(f"Could not save {len(batch)} activities, will retry later")
+        return False
+
+    async def close(self):
+        # Not cancelled, that could interrupt an insert and lose its batch
+        self.stopping = True
+        self.batch_ready.set()
+        await self.flush_task
+        # Anything added while the last flush was running
+        await self.flush()
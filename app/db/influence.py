@@ -3,11 +3,23 @@ import logging
 import pymongo
 
 from app.db import BaseAsyncMongoClient, InfluenceDBModel
+from app.utils.cache import leaderboard_tag, user_tag
 
 logger = logging.getLogger(__name__)
 
 
 class InfluenceMongoClient(BaseAsyncMongoClient):
+    async def invalidate_influence_tags(self, influenced_by: int, influenced_to: int):
+        """Influences of one user, mentions of the other and the leaderboards counting them."""
+        influenced_user = await self.users_collection.find_one(
+            {"id": influenced_to}, {"_id": False, "country": True}
+        )
+        tags = [user_tag(influenced_by), user_tag(influenced_to), leaderboard_tag(None)]
+        if influenced_user is not None:
+            tags.append(leaderboard_tag(influenced_user["country"]))
+        # Mentions and leaderboards are read from replicas
+        await self.invalidate_read_tags(*tags)
+
     async def add_user_influence(self, influence: InfluenceDBModel):
         logger.debug(f"Adding influence: {influence}")
 
@@ -33,6 +45,9 @@ class InfluenceMongoClient(BaseAsyncMongoClient):
                     }
                 },
             )
+            await self.invalidate_influence_tags(
+                influence.influenced_by, influence.influenced_to
+            )
             return update_result["influenced_to"]
 
     async def remove_user_influence(self, influenced_by: int, influenced_to: int):
@@ -44,6 +59,7 @@ class InfluenceMongoClient(BaseAsyncMongoClient):
             {"id": influenced_by, "influence_order": {"$exists": True}},
             {"$pull": {"influence_order": remove_result["influenced_to"]}},
         )
+        await self.invalidate_influence_tags(influenced_by, influenced_to)
 
         return
 
@@ -76,7 +92,7 @@ class InfluenceMongoClient(BaseAsyncMongoClient):
 
     async def get_mentions(self, user_id: int):
         logger.debug(f"Getting user mentions of {user_id}")
-        mentions = await self.influences_collection.find(
+        mentions = await self.influences_read_collection.find(
             {"influenced_to": user_id}
         ).to_list(length=None)
         logger.debug(f"User mentions of {user_id}: {mentions}")
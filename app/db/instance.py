@@ -1,7 +1,20 @@
 from typing import Optional
+
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+    _ServerMode,
+)
+from redis import asyncio as aioredis
+
+from app.config import settings
 from app.db.activity import ActivityMongoClient
 from app.db.influence import InfluenceMongoClient
 from app.db.leaderboard import LeaderboardMongoClient
+from app.db.monitoring import CommandMetricsListener
 from app.db.real_user import RealUserMongoClient
 from app.db.user import UserMongoClient
 
@@ -19,10 +32,54 @@ class AsyncMongoClient(
 # singleton mongo client
 mongo_client: Optional[AsyncMongoClient] = None
 
+# singleton redis client, stays None when redis is not configured (e.g. tests)
+redis_client: Optional[aioredis.Redis] = None
+
+
+READ_PREFERENCES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def mongo_read_preference() -> _ServerMode:
+    if settings.MONGO_READ_PREFERENCE == "primary":
+        return Primary()
+    return READ_PREFERENCES[settings.MONGO_READ_PREFERENCE](
+        max_staleness=settings.MONGO_READ_MAX_STALENESS
+    )
+
+
+def mongo_client_options() -> dict:
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "event_listeners": [CommandMetricsListener()],
+    }
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    return options
 
-def start_mongo_client(mongo_url: str):
+
+def start_mongo_client(mongo_url: str, read_url: Optional[str] = None):
     global mongo_client
-    mongo_client = AsyncMongoClient(mongo_url)
+    read_preference = mongo_read_preference()
+    reads_from_replicas = read_url is not None or read_preference != Primary()
+    mongo_client = AsyncMongoClient(
+        mongo_url,
+        read_url=read_url,
+        read_preference=read_preference,
+        read_staleness=settings.MONGO_READ_MAX_STALENESS
+        if reads_from_replicas
+        else None,
+        **mongo_client_options(),
+    )
 
 
 def close_mongo_client():
@@ -32,3 +89,19 @@ def close_mongo_client():
 
 def get_mongo_db() -> AsyncMongoClient:
     return mongo_client
+
+
+def start_redis_client(redis_url: str):
+    global redis_client
+    redis_client = aioredis.from_url(redis_url)
+
+
+async def close_redis_client():
+    global redis_client
+    if redis_client is not None:
+        await redis_client.close()
+        redis_client = None
+
+
+def get_redis() -> Optional[aioredis.Redis]:
+    return redis_client
@@ -76,7 +76,7 @@ class LeaderboardMongoClient(BaseAsyncMongoClient):
             }
         ]
 
-        result = self.influences_collection.aggregate(pipeline)
+        result = self.influences_read_collection.aggregate(pipeline)
         async for doc in result:
             doc["count"] = doc["count"][0]["total"]
             return doc
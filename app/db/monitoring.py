@@ -0,0 +1,152 @@
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from pymongo import monitoring
+
+from app.config import settings
+from app.utils.metrics import (
+    MONGO_COMMAND_FAILURES,
+    MONGO_COMMAND_SECONDS,
+    MONGO_REQUEST_COMMANDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Commands run outside of a request, e.g. the activity writer
+BACKGROUND_ROUTE = "background"
+# Where each command keeps the part that decides which documents are read
+FILTER_FIELDS = {
+    "find": "filter",
+    "aggregate": "pipeline",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "update": "updates",
+    "delete": "deletes",
+}
+
+
+class RequestCommands:
+    """MongoDB commands of one HTTP request. Motor copies the context to its threads, so listeners see it."""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        # The router puts the matched route in the scope
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+
+request_commands: ContextVar[Optional[RequestCommands]] = ContextVar(
+    "request_commands", default=None
+)
+
+
+def command_collection(event: monitoring.CommandStartedEvent) -> str:
+    if event.command_name == "getMore":
+        return event.command.get("collection", "")
+    target = event.command.get(event.command_name)
+    return target if isinstance(target, str) else ""
+
+
+def value_shape(value):
+    """Keeps field names and operators, replaces values, so the same query with other values looks the same."""
+    if isinstance(value, dict):
+        return {key: value_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        shapes = [value_shape(item) for item in value]
+        # Lists of plain values ($in etc.) only differ in length
+        if all(shape == "?" for shape in shapes):
+            return "?"
+        return shapes
+    return "?"
+
+
+def filter_shape(command_name: str, command: dict) -> str:
+    field = FILTER_FIELDS.get(command_name)
+    if field is None or field not in command:
+        return ""
+    target = command[field]
+    if command_name == "update":
+        target = [update.get("q") for update in target]
+    elif command_name == "delete":
+        target = [delete.get("q") for delete in target]
+    return json.dumps(value_shape(target), default=str)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Records the latency of every command by the route running it, counts commands per request
+    and logs slow commands with the shape of their filter.
+    Called from pymongo's threads, so it only does cheap work for fast commands.
+    """
+
+    def __init__(self):
+        # request id -> (collection, command), only the started event has the command
+        self.commands: dict[int, tuple[str, dict]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        self.commands[event.request_id] = (command_collection(event), event.command)
+
+    def finished(self, event, failed: bool):
+        collection, command = self.commands.pop(event.request_id, ("", {}))
+        seconds = event.duration_micros / 1_000_000
+
+        commands = request_commands.get()
+        route = BACKGROUND_ROUTE
+        if commands is not None:
+            commands.count += 1
+            commands.seconds += seconds
+            route = commands.route
+
+        MONGO_COMMAND_SECONDS.labels(event.command_name, collection, route).observe(
+            seconds
+        )
+        if failed:
+            MONGO_COMMAND_FAILURES.labels(event.command_name, collection, route).inc()
+
+        if seconds * 1000 >= settings.MONGO_SLOW_COMMAND_MS:
+            logger.warning(
+                f"Slow mongo {event.command_name} on {collection} took {seconds * 1000:.0f}ms "
+                f"in {route}: {filter_shape(event.command_name, command)}"
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self.finished(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self.finished(event, failed=True)
+
+
+class RequestCommandsMiddleware:
+    """Counts the MongoDB commands of every HTTP request and logs requests running too many of them."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        commands = RequestCommands(scope)
+        token = request_commands.set(commands)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_commands.reset(token)
+            route = commands.route
+            MONGO_REQUEST_COMMANDS.labels(route).observe(commands.count)
+            if commands.count > settings.MONGO_REQUEST_COMMANDS_WARNING:
+                logger.warning(
+                    f"{scope['method']} {route} ran {commands.count} mongo commands, "
+                    f"{commands.seconds * 1000:.0f}ms of {(time.perf_counter() - start) * 1000:.0f}ms"
+                )
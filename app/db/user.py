@@ -1,10 +1,15 @@
 import base64
 import logging
+from pymongo import ReturnDocument
 from app.db import BaseAsyncMongoClient, Beatmap
 from app.routers.osu_api import UserOsu
+from app.utils.cache import invalidate_tags, leaderboard_tag, user_tag
 
 logger = logging.getLogger(__name__)
 
+# Shown on the leaderboard next to the mention count
+LEADERBOARD_USER_FIELDS = {"username", "avatar_url", "country", "have_ranked_map"}
+
 
 def has_ranked_beatmapsets(user_data: UserOsu) -> bool:
     final_count = user_data.ranked_beatmapset_count
@@ -27,9 +32,27 @@ class UserMongoClient(BaseAsyncMongoClient):
             "have_ranked_map": has_ranked_beatmapsets(user_details),
         }
         logger.debug(f"Upserting user: {db_user}")
-        await self.users_collection.update_one(
-            {"id": user_details.id}, {"$set": db_user}, upsert=True
+        previous = await self.users_collection.find_one_and_update(
+            {"id": user_details.id},
+            {"$set": db_user},
+            projection={"_id": False, **{field: True for field in db_user}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
         )
+        # Every login upserts the user, only invalidate when something changed
+        previous = previous or {}
+        changed = {
+            field for field, value in db_user.items() if previous.get(field) != value
+        }
+        if not changed:
+            return db_user
+
+        tags = [user_tag(user_details.id)]
+        if changed & LEADERBOARD_USER_FIELDS:
+            tags += [leaderboard_tag(None), leaderboard_tag(db_user["country"])]
+            if previous.get("country") not in (None, db_user["country"]):
+                tags.append(leaderboard_tag(previous["country"]))
+        await invalidate_tags(*tags)
         return db_user
 
     async def update_user_bio(self, user_id: int, bio: str):
@@ -38,18 +61,21 @@ class UserMongoClient(BaseAsyncMongoClient):
         await self.users_collection.update_one(
             {"id": user_id}, {"$set": {"bio": bio}}, upsert=True
         )
+        await invalidate_tags(user_tag(user_id))
 
     async def add_beatmap_to_user(self, user_id: int, beatmap: Beatmap):
         logger.debug(f"Adding beatmap to user {user_id}: {beatmap}")
         await self.users_collection.update_one(
             {"id": user_id}, {"$push": {"beatmaps": beatmap.model_dump()}}, upsert=True
         )
+        await invalidate_tags(user_tag(user_id))
 
     async def remove_beatmap_from_user(self, user_id: int, beatmap: Beatmap):
         logger.debug(f"Removing beatmap from user {user_id}: {beatmap}")
         await self.users_collection.update_one(
             {"id": user_id}, {"$pull": {"beatmaps": beatmap.model_dump()}}
         )
+        await invalidate_tags(user_tag(user_id))
 
     async def set_influence_order(self, user_id: int, influence_ids: list[int]):
         user_id_b64 = base64.b64encode(str(user_id).encode())
@@ -61,3 +87,4 @@ class UserMongoClient(BaseAsyncMongoClient):
         await self.users_collection.update_one(
             {"id": user_id}, {"$set": {"influence_order": influence_ids}}
         )
+        await invalidate_tags(user_tag(user_id))
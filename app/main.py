@@ -4,48 +4,74 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from redis import asyncio as aioredis
-import sentry_sdk
-import tracemalloc
 
-
-from app.db.instance import close_mongo_client, start_mongo_client
+from app.db.instance import (
+    close_mongo_client,
+    close_redis_client,
+    get_mongo_db,
+    get_redis,
+    start_mongo_client,
+    start_redis_client,
+)
 from app.routers import (
     activity,
     auth,
+    cache,
+    debug,
     influence,
     osu_api_full_response,
     user,
     leaderboard,
+    metrics,
     osu_api,
 )
 from app.config import settings
-from app.utils.osu_requester import Requester
+from app.db.activity_writer import ActivityWriter
+from app.db.monitoring import RequestCommandsMiddleware
+from app.utils.cache import LocalLRUCache, TwoTierBackend
+from app.utils.cache_warmer import CacheWarmer
+from app.utils.metrics import RouteLatencyMiddleware
+from app.utils.osu_requester import OsuTokenManager, Requester
+from app.utils.profiling import RequestProfilerMiddleware, profiler
+from app.utils.sentry import init_sentry
 
 logger = logging.getLogger(__name__)
 
-tracemalloc.start()
-sentry_sdk.init(
-    dsn=settings.SENTRY_DSN,
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for performance monitoring..
-    traces_sample_rate=1.0,
-    # Set profiles_sample_rate to 1.0 to profile 100%
-    # of sampled transactions.
-    # We recommend adjusting this value in production.
-    profiles_sample_rate=1.0,
-)
+if settings.PROFILING_TRACEMALLOC:
+    # Started on import, allocations made before it are not traced
+    profiler.start_tracemalloc(settings.PROFILING_TRACEMALLOC_FRAMES)
+init_sentry()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     requester = await Requester.get_instance()
-    start_mongo_client(settings.MONGO_URL)
-    redis = aioredis.from_url(settings.REDIS_URL)
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    token_manager = await OsuTokenManager.get_instance()
+    token_manager.start()
+    start_mongo_client(settings.MONGO_URL, settings.MONGO_READ_URL)
+    await get_mongo_db().setup_activity_collection(
+        settings.ACTIVITY_COLLECTION_MAX_BYTES, settings.ACTIVITY_CONVERT_TO_CAPPED
+    )
+    start_redis_client(settings.REDIS_URL)
+    cache_backend = TwoTierBackend(
+        get_redis(),
+        LocalLRUCache(settings.CACHE_LOCAL_MAX_BYTES, settings.CACHE_LOCAL_TTL),
+    )
+    await cache_backend.start()
+    FastAPICache.init(cache_backend, prefix="fastapi-cache")
+    activity_tracker = await activity.ActivityWebsocket.get_instance()
+    await activity_tracker.start_feed(settings.ACTIVITY_FEED_SOURCE, get_redis())
+    # Runs in the background, the app is ready before the cache is warm
+    cache_warmer = await CacheWarmer.get_instance()
+    cache_warmer.start(app, get_redis())
     yield
+    await CacheWarmer.close_instance()
+    await activity.ActivityWebsocket.close_instance()
+    await ActivityWriter.close_instance()
+    await cache_backend.close()
+    await close_redis_client()
     close_mongo_client()
+    await token_manager.close()
     await requester.close()
 
 
@@ -58,6 +84,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RouteLatencyMiddleware)
+app.add_middleware(RequestCommandsMiddleware)
+app.add_middleware(RequestProfilerMiddleware)
 
 app.include_router(auth.router)
 app.include_router(influence.router)
@@ -67,3 +96,6 @@ app.include_router(osu_api.router)
 app.include_router(osu_api_full_response.router)
 app.include_router(activity.websocket_router)
 app.include_router(activity.http_router)
+app.include_router(cache.router)
+app.include_router(metrics.router)
+app.include_router(debug.router)
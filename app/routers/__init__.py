@@ -1,6 +1,16 @@
+import hashlib
+from urllib.parse import urlencode
+
 from fastapi import Request, Response
 
 
+def normalized_request(request: Request) -> str:
+    """Method, path and sorted query of the request, requests that only differ in param order are equal."""
+    path = request.url.path.rstrip("/") or "/"
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"{request.method.lower()} {path}?{query}"
+
+
 def request_key_builder(
     func,
     namespace: str = "",
@@ -9,11 +19,11 @@ def request_key_builder(
     response: Response = None,
     **kwargs,
 ):
-    return ":".join(
-        [
-            namespace,
-            request.method.lower(),
-            request.url.path,
-            repr(sorted(request.query_params.items())),
-        ]
-    )
+    """
+    Fixed length key no matter how long the query is.
+    The namespace stays readable, so a namespace can still be cleared.
+    """
+    digest = hashlib.blake2b(
+        normalized_request(request).encode(), digest_size=16
+    ).hexdigest()
+    return f"{namespace}:{digest}"
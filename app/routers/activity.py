@@ -1,21 +1,47 @@
 import asyncio
+from collections import Counter, defaultdict, deque
 import datetime
 from enum import Enum
+import json
 import logging
-from typing import Optional
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+import struct
+from typing import Annotated, Optional
+from bson import ObjectId
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.websockets import WebSocketState
-from pydantic import BaseModel
-from copy import deepcopy
+import msgpack
+from pydantic import BaseModel, Field, ValidationError
+from redis import asyncio as aioredis
+from functools import cached_property, partial
 
+from app.config import settings
 from app.db import Beatmap
-from app.db.instance import get_mongo_db
+from app.db.activity import activity_from_document
+from app.db.activity_writer import ActivityWriter
+from app.db.instance import get_mongo_db, AsyncMongoClient
+from app.utils.metrics import ACTIVITY_BROADCAST_SECONDS, WEBSOCKET_CONNECTIONS
 
 
 logger = logging.getLogger(__name__)
 
 websocket_router = APIRouter(prefix="/ws", tags=["websocket"])
 
+ACTIVITY_CHANNEL = "activity:events"
+ACTIVITY_RECENT_KEY = "activity:recent"
+ACTIVITY_SEQ_KEY = "activity:seq"
+# user id, group, influenced to id
+ACTIVITY_SPAM_KEY = "activity:spam:{}:{}:{}"
+# Clients asking for this subprotocol get activities as binary msgpack frames instead of json text
+ACTIVITY_MSGPACK_SUBPROTOCOL = "msgpack"
+
 
 class ActivityType(Enum):
     EDIT_BIO = "EDIT_BIO"
@@ -55,28 +81,308 @@ class ActivityDetails(BaseModel):
 
 
 class Activity(BaseModel):
+    id: Optional[str] = None
+    # Monotonic across workers, clients resume with /ws?since=<seq>
+    seq: Optional[int] = None
     type: ActivityType
     user: ActivityUser
     datetime: datetime.datetime
     details: ActivityDetails
 
 
+class ActivitySubscription(BaseModel):
+    """
+    Sent by websocket clients to only receive the activities they are interested in.
+    Fields that are not set match everything, set fields must all match.
+    """
+
+    # Activities done by or influencing these users
+    user_ids: Optional[set[int]] = Field(default=None, max_length=100)
+    types: Optional[set[ActivityType]] = None
+    groups: Optional[set[ActivityGroup]] = None
+    countries: Optional[set[str]] = Field(default=None, max_length=100)
+
+    @cached_property
+    def activity_types(self) -> set[str]:
+        activity_types = {type.value for type in self.types or ()}
+        activity_types.update(
+            type
+            for type, group in activity_type_group_map.items()
+            if group in (self.groups or ())
+        )
+        return activity_types
+
+    def is_unfiltered(self) -> bool:
+        return not (self.user_ids or self.activity_types or self.countries)
+
+    def index_keys(self) -> list[tuple[str, int | str]]:
+        """Keys of the most selective filter, connections are indexed under these."""
+        if self.user_ids:
+            return [("user", user_id) for user_id in self.user_ids]
+        if self.countries:
+            return [("country", country) for country in self.countries]
+        return [("type", type) for type in self.activity_types]
+
+    def matches(self, activity: dict) -> bool:
+        if self.user_ids and self.user_ids.isdisjoint(activity_user_ids(activity)):
+            return False
+        if self.activity_types and activity["type"] not in self.activity_types:
+            return False
+        if self.countries and activity["user"]["country"] not in self.countries:
+            return False
+        return True
+
+
 @websocket_router.websocket("")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+async def websocket_endpoint(websocket: WebSocket, since: Optional[int] = None):
+    """
+    The first message is a json array of the latest activities, every following message is a single activity.
+    Reconnecting clients can pass the `seq` of the last activity they received as `since`
+    to only get the ones they missed. If too much was missed the full snapshot is sent instead,
+    so clients should merge the first message by `seq`.
+    Messages are msgpack encoded binary frames if the client requests the `msgpack` subprotocol.
+    Clients can send an `ActivitySubscription` at any time, which is answered with
+    the latest activities that match it, only matching activities are sent after that.
+    """
+    binary = ACTIVITY_MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    await websocket.accept(subprotocol=ACTIVITY_MSGPACK_SUBPROTOCOL if binary else None)
 
     activity_tracker = await ActivityWebsocket.get_instance()
-    await activity_tracker.add_connection(websocket)
+    await activity_tracker.add_connection(websocket, since, binary)
 
     try:
-        # I guess we need this to track disconnects
+        # Also tracks disconnects
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            subscription = parse_subscription(message)
+            if subscription is not None:
+                activity_tracker.subscribe(websocket, subscription)
 
     except WebSocketDisconnect:
-        activity_tracker.remove_connection(websocket)
         return
 
+    finally:
+        activity_tracker.remove_connection(websocket)
+
+
+def encode_activity(activity: dict) -> str:
+    return json.dumps(activity, separators=(",", ":"), ensure_ascii=False)
+
+
+def parse_subscription(message: dict) -> Optional[ActivitySubscription]:
+    try:
+        if message.get("bytes") is not None:
+            data = msgpack.unpackb(message["bytes"])
+        else:
+            data = json.loads(message["text"])
+        return ActivitySubscription.model_validate(data)
+    except (ValueError, ValidationError, msgpack.UnpackException) as ex:
+        logger.debug(f"Ignoring invalid websocket message: {ex!r}")
+        return None
+
+
+def activity_user_ids(activity: dict) -> set[int]:
+    user_ids = {activity["user"]["id"]}
+    if activity["details"]["influenced_to"] is not None:
+        user_ids.add(activity["details"]["influenced_to"]["id"])
+    return user_ids
+
+
+def activity_index_keys(activity: dict) -> list[tuple[str, int | str]]:
+    """Index keys a subscription matching this activity might be indexed under."""
+    keys = [("user", user_id) for user_id in activity_user_ids(activity)]
+    keys.append(("country", activity["user"]["country"]))
+    keys.append(("type", activity["type"]))
+    return keys
+
+
+def pack_activity(activity: dict) -> bytes:
+    return msgpack.packb(activity)
+
+
+def join_encoded(encoded: list[str]) -> str:
+    return "[" + ",".join(encoded) + "]"
+
+
+def join_packed(packed: list[bytes]) -> bytes:
+    """msgpack array of already packed items."""
+    length = len(packed)
+    if length < 16:
+        header = bytes([0x90 | length])
+    elif length < 2**16:
+        header = struct.pack("!BH", 0xDC, length)
+    else:
+        header = struct.pack("!BI", 0xDD, length)
+    return header + b"".join(packed)
+
+
+def spam_key(user_id: int, group: ActivityGroup, influenced_to_id: Optional[int]):
+    """Activities with the same key are considered duplicates of each other."""
+    match group:
+        case ActivityGroup.INFLUENCE_ADD | ActivityGroup.INFLUENCE_REMOVE:
+            return (user_id, group, influenced_to_id)
+        case _:
+            return (user_id, group, None)
+
+
+def activity_spam_key(activity: dict):
+    influenced_to = activity["details"]["influenced_to"]
+    return spam_key(
+        activity["user"]["id"],
+        activity_type_group_map[activity["type"]],
+        influenced_to["id"] if influenced_to is not None else None,
+    )
+
+
+class ActivityQueue:
+    """
+    Fixed size ring buffer of the latest activities with their json and msgpack encodings.
+    Keeps a count of activities per spam key, so duplicate checks don't scan the queue.
+    """
+
+    def __init__(self, size: int):
+        self.activities: deque[tuple[dict, str, bytes]] = deque(maxlen=size)
+        self.spam_keys: Counter = Counter()
+        self.ids: set[str] = set()
+        # binary -> snapshot
+        self.snapshot_cache: dict[bool, str | bytes] = {}
+        # Not reset on clear, so sequence ids keep increasing
+        self.last_seq = 0
+
+    def __len__(self):
+        return len(self.activities)
+
+    def __contains__(self, key) -> bool:
+        return self.spam_keys[key] > 0
+
+    def push(self, activity: dict, encoded: str, packed: Optional[bytes] = None):
+        if len(self.activities) == self.activities.maxlen:
+            evicted, _, _ = self.activities[0]
+            evicted_key = activity_spam_key(evicted)
+            self.spam_keys[evicted_key] -= 1
+            if self.spam_keys[evicted_key] <= 0:
+                del self.spam_keys[evicted_key]
+            self.ids.discard(evicted.get("id"))
+
+        if packed is None:
+            packed = pack_activity(activity)
+        self.activities.append((activity, encoded, packed))
+        self.spam_keys[activity_spam_key(activity)] += 1
+        if activity.get("id") is not None:
+            self.ids.add(activity["id"])
+        self.snapshot_cache.clear()
+        self.last_seq = max(self.last_seq, activity.get("seq") or 0)
+
+    def clear(self):
+        self.activities.clear()
+        self.spam_keys.clear()
+        self.ids.clear()
+        self.snapshot_cache.clear()
+
+    def matching(
+        self, subscription: ActivitySubscription, binary: bool = False
+    ) -> str | bytes:
+        entries = [entry for entry in self.activities if subscription.matches(entry[0])]
+        return self.join(entries, binary)
+
+    def join(self, entries, binary: bool) -> str | bytes:
+        if binary:
+            return join_packed([packed for _, _, packed in entries])
+        return join_encoded([encoded for _, encoded, _ in entries])
+
+    def snapshot(self, binary: bool = False) -> str | bytes:
+        """Array of the queue built from the pre-encoded activities, cached until the queue changes."""
+        if binary not in self.snapshot_cache:
+            self.snapshot_cache[binary] = self.join(self.activities, binary)
+        return self.snapshot_cache[binary]
+
+    def since(self, seq: int, binary: bool = False) -> Optional[str | bytes]:
+        """
+        Array of the activities after `seq`.
+        None if some of them are no longer in the queue, or `seq` is from a sequence we don't know.
+        """
+        if seq > self.last_seq:
+            return None
+
+        # Scans the whole queue, concurrent publishes can arrive slightly out of order
+        missed = []
+        oldest_seq = None
+        for entry in self.activities:
+            activity_seq = entry[0].get("seq") or 0
+            if oldest_seq is None or activity_seq < oldest_seq:
+                oldest_seq = activity_seq
+            if activity_seq > seq:
+                missed.append(entry)
+
+        if seq < self.last_seq and (oldest_seq is None or oldest_seq > seq + 1):
+            # Activities right after `seq` were already evicted
+            return None
+        return self.join(missed, binary)
+
+
+class ActivityConnection:
+    """
+    A websocket client with its own bounded outbound queue, drained by a dedicated task.
+    A slow client only fills up its own queue instead of delaying everyone else.
+    Binary connections are sent msgpack frames, the others json text.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        queue_size: int,
+        send_timeout: float,
+        binary: bool = False,
+    ):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.send_timeout = send_timeout
+        self.binary = binary
+        self.subscription: Optional[ActivitySubscription] = None
+        self.sender_task: Optional[asyncio.Task] = None
+
+    def start(self, on_close):
+        self.sender_task = asyncio.create_task(self.drain(on_close))
+
+    def send(self, message: str | bytes) -> bool:
+        """Returns False if the client can't keep up."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def is_alive(self) -> bool:
+        return (
+            self.websocket.application_state == WebSocketState.CONNECTED
+            and self.websocket.client_state == WebSocketState.CONNECTED
+            and self.sender_task is not None
+            and not self.sender_task.done()
+        )
+
+    async def drain(self, on_close):
+        send = self.websocket.send_bytes if self.binary else self.websocket.send_text
+        try:
+            while True:
+                message = await self.queue.get()
+                await asyncio.wait_for(send(message), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.debug(f"Dropping websocket connection: {ex!r}")
+            on_close(self.websocket)
+
+    async def close(self, code: int = 1000):
+        if self.sender_task is not None:
+            self.sender_task.cancel()
+        if self.websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await self.websocket.close(code)
+            except Exception:
+                pass
+
 
 class ActivityWebsocket:
     _instance = None
@@ -89,80 +395,416 @@ class ActivityWebsocket:
             async with cls._lock:
                 if cls._instance is None:  # Double-check locking
                     cls._instance = ActivityWebsocket()
-                    cls._instance.connections = []
-                    cls._instance.queue_size = 50
-                    cls._instance.activity_queue = []
-
-                    mongo_db = get_mongo_db()
-                    db_activities = await mongo_db.get_latest_activities(50)
-                    db_activities.reverse()
-                    cls._instance.activity_queue = db_activities
+                    cls._instance.connections = {}
+                    # Connections without a subscription get everything
+                    cls._instance.unfiltered = set()
+                    # (filter, value) -> websockets subscribed to it
+                    cls._instance.subscriptions = defaultdict(set)
+                    cls._instance.queue_size = settings.ACTIVITY_QUEUE_SIZE
+                    cls._instance.activity_queue = ActivityQueue(
+                        cls._instance.queue_size
+                    )
+                    cls._instance.heartbeat_task = asyncio.create_task(
+                        cls._instance.heartbeat()
+                    )
+                    # Tasks are only weakly referenced by the loop
+                    cls._instance.closing_tasks = set()
+                    cls._instance.redis = None
+                    # Without a feed activities are only delivered to this process' clients
+                    cls._instance.feed_source = None
+                    cls._instance.feed_task = None
+                    cls._instance.local_seq = 0
 
         return cls._instance
 
-    def clear_queue(self):
-        self.activity_queue = []
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance is not None:
+            await cls._instance.close()
+            cls._instance = None
+
+    async def close(self):
+        self.heartbeat_task.cancel()
+        if self.feed_task is not None:
+            self.feed_task.cancel()
+        for connection in list(self.connections.values()):
+            await connection.close(1001)
+        await asyncio.gather(*self.closing_tasks)
+        WEBSOCKET_CONNECTIONS.dec(len(self.connections))
+        self.connections.clear()
+        self.unfiltered.clear()
+        self.subscriptions.clear()
 
-    async def add_connection(self, websocket: WebSocket):
-        """Immidiately sends activities to new clients."""
-        self.connections.append(websocket)
-        if websocket.application_state == WebSocketState.CONNECTED:
-            await websocket.send_json(self.activity_queue)
+    def clear_queue(self):
+        self.activity_queue.clear()
+
+    async def start_feed(self, source: str, redis: Optional[aioredis.Redis]):
+        """
+        Share activities between workers and nodes, and load the latest ones.
+
+        "redis": activities are published to a channel every worker subscribes to,
+        and the latest ones are kept in a redis list for the initial snapshot.
+        "mongo": every worker tails the capped activity collection. Activities show up
+        on other workers once the ActivityWriter flushed them.
+        Redis is also used for sequence ids when it's available.
+        """
+        self.redis = redis
+        self.feed_source = (
+            "redis" if source == "redis" and redis is not None else "mongo"
+        )
+        started = asyncio.Event()
+        if self.feed_source == "redis":
+            self.feed_task = asyncio.create_task(self.listen(started))
+        else:
+            self.feed_task = asyncio.create_task(self.tail(started))
+        await started.wait()
+
+    async def load_latest_activities(self):
+        """Newest activities in the database, used when nothing is shared through redis yet."""
+        activities = await get_mongo_db().get_latest_activities(self.queue_size)
+        activities.reverse()
+        for activity in activities:
+            self.activity_queue.push(activity, encode_activity(activity))
+
+    async def seed_seq(self):
+        """Continue the sequence of the loaded activities if redis doesn't have one."""
+        if self.redis is not None:
+            await self.redis.set(
+                ACTIVITY_SEQ_KEY, self.activity_queue.last_seq, nx=True
+            )
+
+    async def load_recent_activities(self):
+        encoded_activities = await self.redis.lrange(
+            ACTIVITY_RECENT_KEY, -self.queue_size, -1
+        )
+        if encoded_activities:
+            self.activity_queue.clear()
+            for encoded in encoded_activities:
+                encoded = encoded.decode()
+                self.activity_queue.push(json.loads(encoded), encoded)
+        elif not self.activity_queue:
+            await self.load_latest_activities()
+        await self.seed_seq()
+
+    async def tail(self, started: asyncio.Event):
+        """
+        Delivers activities other workers saved to the capped collection. Reconnects forever.
+
+        Activities are written in batches, so their ids are not in insertion order.
+        The cursor follows the collection's natural order, and a new one starts at the latest
+        activities again, the ones already delivered are skipped by id.
+        The first cursor's latest activities fill the queue instead of being delivered.
+        """
+        mongo_db = get_mongo_db()
+        seeding = True
+        while True:
+            try:
+                cursor = await mongo_db.tail_activities(overlap=self.queue_size)
+                seeded = 0
+                while cursor.alive:
+                    try:
+                        document = await cursor.next()
+                    except StopAsyncIteration:
+                        # Nothing new within the await time, the cursor is still open
+                        if seeding:
+                            seeding = False
+                            await self.finish_seeding(started)
+                        continue
+                    activity = activity_from_document(document)
+                    # Activities of this worker were delivered when they were created
+                    if activity["id"] in self.activity_queue.ids:
+                        continue
+                    if not seeding:
+                        self.deliver(activity, encode_activity(activity))
+                        continue
+                    self.activity_queue.push(activity, encode_activity(activity))
+                    seeded += 1
+                    if seeded >= self.queue_size:
+                        seeding = False
+                        await self.finish_seeding(started)
+                # The cursor dies while the collection is empty
+                if seeding:
+                    seeding = False
+                    await self.finish_seeding(started)
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning(
+                    "Activity collection tailer disconnected, retrying", exc_info=True
+                )
+                # Don't block startup when mongo is down
+                started.set()
+                await asyncio.sleep(1)
+
+    async def finish_seeding(self, started: asyncio.Event):
+        await self.seed_seq()
+        started.set()
+
+    async def listen(self, subscribed: asyncio.Event):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(ACTIVITY_CHANNEL)
+                # Subscribed before loading, so nothing published in between is lost
+                await self.load_recent_activities()
+                subscribed.set()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    encoded = message["data"].decode()
+                    self.deliver(json.loads(encoded), encoded)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning(
+                    "Activity fan-out listener disconnected, retrying", exc_info=True
+                )
+                # Don't block startup when redis is down, we'll catch up on reconnect
+                subscribed.set()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.reset()
+
+    async def publish(self, activity: dict, encoded: str):
+        if self.feed_source != "redis":
+            self.deliver(activity, encoded)
+            return
+
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.publish(ACTIVITY_CHANNEL, encoded)
+                pipe.rpush(ACTIVITY_RECENT_KEY, encoded)
+                pipe.ltrim(ACTIVITY_RECENT_KEY, -self.queue_size, -1)
+                await pipe.execute()
+        except Exception:
+            logger.warning(
+                "Could not publish activity, delivering locally", exc_info=True
+            )
+            self.deliver(activity, encoded)
+
+    async def claim_spam_key(self, key) -> bool:
+        """
+        Atomic across workers, the local queue check misses duplicates another worker accepted meanwhile.
+        Without redis, or when it fails, only the local check is done.
+        """
+        if self.redis is None:
+            return True
+        user_id, group, influenced_to_id = key
+        try:
+            return bool(
+                await self.redis.set(
+                    ACTIVITY_SPAM_KEY.format(user_id, group.value, influenced_to_id),
+                    1,
+                    nx=True,
+                    ex=settings.ACTIVITY_SPAM_TTL,
+                )
+            )
+        except Exception:
+            logger.warning("Could not check activity spam key in redis", exc_info=True)
+            return True
+
+    async def next_seq(self) -> int:
+        if self.redis is not None:
+            try:
+                return await self.redis.incr(ACTIVITY_SEQ_KEY)
+            except Exception:
+                logger.warning(
+                    "Could not get activity sequence from redis, using local sequence",
+                    exc_info=True,
+                )
+        self.local_seq = max(self.local_seq, self.activity_queue.last_seq) + 1
+        return self.local_seq
+
+    def deliver(self, activity: dict, encoded: str):
+        packed = pack_activity(activity)
+        self.activity_queue.push(activity, encoded, packed)
+        self.broadcast(activity, encoded, packed)
+
+    async def add_connection(
+        self, websocket: WebSocket, since: Optional[int] = None, binary: bool = False
+    ):
+        """Immidiately sends activities to new clients, only the missed ones for clients that resume."""
+        connection = ActivityConnection(
+            websocket,
+            settings.ACTIVITY_SEND_QUEUE_SIZE,
+            settings.ACTIVITY_SEND_TIMEOUT,
+            binary,
+        )
+        self.connections[websocket] = connection
+        self.unfiltered.add(websocket)
+        WEBSOCKET_CONNECTIONS.inc()
+        initial = None
+        if since is not None:
+            initial = self.activity_queue.since(since, binary)
+        if initial is None:
+            initial = self.activity_queue.snapshot(binary)
+        connection.send(initial)
+        # 1011: Internal Error, the client stopped accepting messages
+        connection.start(on_close=partial(self.drop_connection, code=1011))
 
     def remove_connection(self, websocket: WebSocket):
-        self.connections.remove(websocket)
-
-    async def broadcast(self, activity):
-        for websocket in self.connections:
-            if websocket.application_state == WebSocketState.CONNECTED:
-                await websocket.send_json(activity)
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            WEBSOCKET_CONNECTIONS.dec()
+            self.unindex_connection(websocket, connection)
+            if connection.sender_task is not None:
+                connection.sender_task.cancel()
+
+    def drop_connection(self, websocket: WebSocket, code: int):
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            WEBSOCKET_CONNECTIONS.dec()
+            self.unindex_connection(websocket, connection)
+            task = asyncio.create_task(connection.close(code))
+            self.closing_tasks.add(task)
+            task.add_done_callback(self.closing_tasks.discard)
+
+    def index_connection(self, websocket: WebSocket, connection: ActivityConnection):
+        if connection.subscription is None or connection.subscription.is_unfiltered():
+            self.unfiltered.add(websocket)
+            return
+        for key in connection.subscription.index_keys():
+            self.subscriptions[key].add(websocket)
+
+    def unindex_connection(self, websocket: WebSocket, connection: ActivityConnection):
+        self.unfiltered.discard(websocket)
+        if connection.subscription is None:
+            return
+        for key in connection.subscription.index_keys():
+            subscribers = self.subscriptions.get(key)
+            if subscribers is None:
+                continue
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.subscriptions[key]
+
+    def subscribe(self, websocket: WebSocket, subscription: ActivitySubscription):
+        """Replaces the subscription of a connection and sends it the latest matching activities."""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        self.unindex_connection(websocket, connection)
+        connection.subscription = subscription
+        self.index_connection(websocket, connection)
+        if not connection.send(
+            self.activity_queue.matching(subscription, connection.binary)
+        ):
+            self.drop_connection(websocket, 1013)
+
+    def recipients(self, activity: dict):
+        """Unfiltered connections and the indexed ones whose subscription matches the activity."""
+        yield from list(self.unfiltered)
+
+        candidates = set()
+        for key in activity_index_keys(activity):
+            candidates.update(self.subscriptions.get(key, ()))
+        for websocket in candidates:
+            connection = self.connections.get(websocket)
+            if connection is not None and connection.subscription.matches(activity):
+                yield websocket
+
+    @ACTIVITY_BROADCAST_SECONDS.time()
+    def broadcast(self, activity: dict, encoded_activity: str, packed_activity: bytes):
+        """Only enqueues the activity, every connection sends it on its own task."""
+        for websocket in self.recipients(activity):
+            connection = self.connections.get(websocket)
+            if connection is None:
+                continue
+            message = packed_activity if connection.binary else encoded_activity
+            if not connection.send(message):
+                logger.info("Dropping websocket client that can't keep up")
+                # 1013: Try Again Later
+                self.drop_connection(websocket, 1013)
+
+    async def heartbeat(self):
+        """
+        Reaps connections that died without us noticing. Dead peers are found by uvicorn's
+        protocol level pings (--ws-ping-interval, --ws-ping-timeout), failed sends by the sender tasks.
+        """
+        while True:
+            await asyncio.sleep(settings.ACTIVITY_HEARTBEAT_INTERVAL)
+            for websocket, connection in list(self.connections.items()):
+                if not connection.is_alive():
+                    self.drop_connection(websocket, 1001)
 
     async def collect_acitivity(
         self, type: ActivityType, user_data: dict, details: ActivityDetails
     ):
-        """Add latest activity to the queue and broadcast it to all clients."""
+        """Add latest activity to the queue and broadcast it to all clients of every worker."""
 
         # Spam prevention
-        new_activity_group = activity_type_group_map[type.value]
-        for activity in self.activity_queue:
-            if (
-                activity["user"]["id"] == user_data["id"]
-                and new_activity_group == activity_type_group_map[activity["type"]]
-            ):
-                match new_activity_group:
-                    case ActivityGroup.BIO:
-                        return
-                    case ActivityGroup.BEATMAP:
-                        return
-                    case ActivityGroup.INFLUENCE_ADD | ActivityGroup.INFLUENCE_REMOVE:
-                        if (
-                            activity["details"]["influenced_to"]["id"]
-                            == details.influenced_to.id
-                        ):
-                            return
+        influenced_to_id = (
+            details.influenced_to.id if details.influenced_to is not None else None
+        )
+        key = spam_key(
+            user_data["id"], activity_type_group_map[type.value], influenced_to_id
+        )
+        if key in self.activity_queue or not await self.claim_spam_key(key):
+            return
 
         user = ActivityUser.model_validate(user_data)
-        activity = Activity(
-            type=type, user=user, datetime=datetime.datetime.now(), details=details
+        activity_model = Activity(
+            id=str(ObjectId()),
+            seq=await self.next_seq(),
+            type=type,
+            user=user,
+            datetime=datetime.datetime.now(),
+            details=details,
         )
-        activity = activity.model_dump(mode="json")
+        activity = activity_model.model_dump(mode="json")
+        # Encoded once here, every client gets the same text
+        encoded_activity = activity_model.model_dump_json()
 
-        self.activity_queue.append(activity)
-        if len(self.activity_queue) > self.queue_size:
-            self.activity_queue.pop(0)
-        await self.broadcast(activity)
+        await self.publish(activity, encoded_activity)
 
-        mongo_db = get_mongo_db()
-        # pymongo functions edis in place
-        # That means all the activity objects in activity queue magically have _id field unless we deepcopy
-        await mongo_db.save_activity(deepcopy(activity))
+        activity_writer = await ActivityWriter.get_instance()
+        activity_writer.add(activity)
 
 
 http_router = APIRouter(prefix="/activity", tags=["activity"])
 
+ACTIVITY_PAGE_SIZE = 50
+ACTIVITY_PAGE_MAX = 100
+
 
-@http_router.get("", response_model=list[Activity])
+def validate_activity_id(before: Optional[str] = None):
+    if before is not None and not ObjectId.is_valid(before):
+        raise HTTPException(status_code=400, detail="Invalid activity id")
+    return before
+
+
+@http_router.get(
+    "",
+    response_model=list[Activity],
+    summary="Latest activities oldest first, pass the first activity's id as `before` for the page before it",
+)
 async def activity(
+    before: Annotated[Optional[str], Depends(validate_activity_id)],
+    limit: Annotated[Optional[int], Query(ge=1, le=ACTIVITY_PAGE_MAX)] = None,
     activity_tracker: ActivityWebsocket = Depends(ActivityWebsocket.get_instance),
+    mongo_db: AsyncMongoClient = Depends(get_mongo_db),
+):
+    if before is None and limit is None:
+        return Response(
+            content=activity_tracker.activity_queue.snapshot(),
+            media_type="application/json",
+        )
+    activities = await mongo_db.get_activities(before, limit or ACTIVITY_PAGE_SIZE)
+    # Same order as the queue
+    activities.reverse()
+    return activities
+
+
+@http_router.get(
+    "/user/{user_id}",
+    response_model=list[Activity],
+    summary="Activities of a user newest first, paginate with `before`",
+)
+async def user_activity(
+    user_id: int,
+    before: Annotated[Optional[str], Depends(validate_activity_id)],
+    limit: Annotated[int, Query(ge=1, le=ACTIVITY_PAGE_MAX)] = ACTIVITY_PAGE_SIZE,
+    mongo_db: AsyncMongoClient = Depends(get_mongo_db),
 ):
-    return activity_tracker.activity_queue
+    return await mongo_db.get_activities(before, limit, user_id=user_id)
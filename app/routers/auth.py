@@ -1,15 +1,16 @@
 from datetime import timedelta
 import logging
+from typing import Annotated, Optional
 import aiohttp
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Cookie, Depends, Response
 from fastapi.responses import RedirectResponse
 
 from app.config import settings
-from app.db.instance import get_mongo_db, AsyncMongoClient
+from app.db.instance import get_mongo_db, get_redis, AsyncMongoClient
 from app.routers.osu_api import UserOsu
-from app.utils.jwt import obtain_jwt
+from app.utils.jwt import obtain_jwt, verified_tokens
 from app.utils.osu_requester import Requester
-import tracemalloc
+from app.utils.session import create_session, delete_session, is_session_id
 
 logger = logging.getLogger(__name__)
 
@@ -27,44 +28,50 @@ async def osu_oauth2_redirect(
     user = await get_osu_user(requester, access_token["access_token"])
     await mongo_db.add_real_user(user)
     db_user = await mongo_db.create_user(user_details=user)
-    db_user["access_token"] = access_token["access_token"]
-    jwt_token = obtain_jwt(
-        db_user, expires_delta=timedelta(seconds=access_token["expires_in"])
-    )
+
+    redis = get_redis()
+    if redis is not None:
+        # The cookie only holds the session id
+        user_token = await create_session(redis, db_user)
+        max_age = settings.SESSION_TTL
+    else:
+        db_user["access_token"] = access_token["access_token"]
+        user_token = obtain_jwt(
+            db_user, expires_delta=timedelta(seconds=access_token["expires_in"])
+        )
+        max_age = access_token["expires_in"]
+
     redirect_response.set_cookie(
         key="user_token",
-        value=jwt_token,
+        value=user_token,
         httponly=True,
-        max_age=access_token["expires_in"],
+        max_age=max_age,
     )
 
     return redirect_response
 
 
 @router.get("/logout", summary="Logs out the user. (basically removes the cookie)")
-async def logout(response: Response):
+async def logout(
+    response: Response, user_token: Annotated[Optional[str], Cookie()] = None
+):
+    if user_token is not None:
+        verified_tokens.pop(user_token)
+        redis = get_redis()
+        if is_session_id(user_token) and redis is not None:
+            await delete_session(redis, user_token)
     response.delete_cookie("user_token")
     return
 
 
-@router.get("/test", summary="Logs out the user. (basically removes the cookie)")
-async def test(response: Response):
-    data = {"memory": tracemalloc.get_traced_memory()}
-    snapshot = tracemalloc.take_snapshot()
-    top_stats = snapshot.statistics("lineno")
-    for idx, stat in enumerate(top_stats[:10]):
-        data[idx] = str(stat)
-    return data
-
-
 async def get_osu_user(requester, access_token: str):
-    me_url = "https://osu.ppy.sh/api/v2/me"
+    me_url = f"{settings.OSU_BASE_URL}/api/v2/me"
     auth_header = {"Authorization": f"Bearer {access_token}"}
     return await requester.request("GET", UserOsu, me_url, auth_header)
 
 
 async def get_osu_auth_token(code: str):
-    token_url = "https://osu.ppy.sh/oauth/token"
+    token_url = f"{settings.OSU_BASE_URL}/oauth/token"
     async with aiohttp.ClientSession() as session:
         async with session.post(
             token_url,
@@ -0,0 +1,56 @@
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from app.utils.cache import cache_stats
+from app.utils.jwt import verified_tokens
+
+router = APIRouter(prefix="/cache", tags=["cache"])
+
+
+class CacheEndpointStatsResponse(BaseModel):
+    endpoint: str
+    hits: int
+    misses: int
+    stale_hits: int
+    encode_seconds: float
+    saved_cpu_seconds: float
+
+
+@router.get(
+    "/stats",
+    response_model=list[CacheEndpointStatsResponse],
+    summary="Cache hits and serialization CPU time saved per cached endpoint",
+)
+async def get_cache_stats():
+    return [
+        CacheEndpointStatsResponse(
+            endpoint=endpoint,
+            hits=stats.hits,
+            misses=stats.misses,
+            stale_hits=stats.stale_hits,
+            encode_seconds=stats.encode_seconds,
+            saved_cpu_seconds=stats.saved_cpu_seconds,
+        )
+        for endpoint, stats in cache_stats.items()
+    ]
+
+
+class TokenCacheStatsResponse(BaseModel):
+    size: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+@router.get(
+    "/tokens",
+    response_model=TokenCacheStatsResponse,
+    summary="Hits of the verified auth token cache",
+)
+async def get_token_cache_stats():
+    return TokenCacheStatsResponse(
+        size=len(verified_tokens),
+        hits=verified_tokens.stats.hits,
+        misses=verified_tokens.stats.misses,
+        hit_rate=verified_tokens.stats.hit_rate,
+    )
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel
+
+from app.config import settings
+from app.utils.jwt import require_admin
+from app.utils.profiling import profiler
+
+router = APIRouter(
+    prefix="/debug", tags=["debug"], dependencies=[Depends(require_admin)]
+)
+
+MemoryKeyType = Literal["lineno", "filename", "traceback"]
+ProfileSort = Literal["cumulative", "tottime", "calls", "ncalls"]
+
+
+class ProfilingStatusResponse(BaseModel):
+    tracemalloc: bool
+    traced_memory: int
+    traced_memory_peak: int
+    profile_requests: bool
+    request_profiles: int
+
+
+class MemoryStatsResponse(BaseModel):
+    traced_memory: int
+    traced_memory_peak: int
+    stats: list[str]
+
+
+class RequestProfileResponse(BaseModel):
+    id: str
+    method: str
+    path: str
+    created_at: datetime
+    duration: float
+
+
+@router.get(
+    "/profiling",
+    response_model=ProfilingStatusResponse,
+    summary="Which profilers are running on this worker",
+)
+async def get_profiling_status():
+    traced_memory, traced_memory_peak = tracemalloc.get_traced_memory()
+    return ProfilingStatusResponse(
+        tracemalloc=tracemalloc.is_tracing(),
+        traced_memory=traced_memory,
+        traced_memory_peak=traced_memory_peak,
+        profile_requests=profiler.profile_requests,
+        request_profiles=len(profiler.request_profiles),
+    )
+
+
+@router.post("/tracemalloc/start", summary="Starts tracing allocations")
+async def start_tracemalloc(
+    frames: int = Query(settings.PROFILING_TRACEMALLOC_FRAMES, ge=1, le=100),
+):
+    profiler.start_tracemalloc(frames)
+
+
+@router.post("/tracemalloc/stop", summary="Stops tracing allocations")
+async def stop_tracemalloc():
+    profiler.stop_tracemalloc()
+
+
+def memory_stats_response(stats: list[str]) -> MemoryStatsResponse:
+    traced_memory, traced_memory_peak = tracemalloc.get_traced_memory()
+    return MemoryStatsResponse(
+        traced_memory=traced_memory,
+        traced_memory_peak=traced_memory_peak,
+        stats=stats,
+    )
+
+
+@router.get(
+    "/tracemalloc/snapshot",
+    response_model=MemoryStatsResponse,
+    summary="Biggest allocations, the snapshot is the baseline of the next diff",
+)
+async def get_memory_snapshot(
+    key_type: MemoryKeyType = "lineno", limit: int = Query(20, ge=1, le=500)
+):
+    return memory_stats_response(profiler.memory_top(key_type, limit))
+
+
+@router.get(
+    "/tracemalloc/diff",
+    response_model=MemoryStatsResponse,
+    summary="Allocation growth since the previous snapshot or diff",
+)
+async def get_memory_diff(
+    key_type: MemoryKeyType = "lineno", limit: int = Query(20, ge=1, le=500)
+):
+    return memory_stats_response(profiler.memory_diff(key_type, limit))
+
+
+@router.get(
+    "/cpu",
+    response_class=PlainTextResponse,
+    summary="Samples the event loop for some seconds, returns collapsed stacks for flame graphs",
+)
+async def get_cpu_profile(
+    seconds: float = Query(10, gt=0, le=settings.PROFILING_CPU_MAX_SECONDS),
+):
+    # The sampler runs in another thread, so the loop keeps serving what is being profiled
+    loop_thread_id = threading.get_ident()
+    return await asyncio.to_thread(
+        profiler.sample_cpu,
+        loop_thread_id,
+        seconds,
+        settings.PROFILING_CPU_SAMPLE_INTERVAL,
+    )
+
+
+@router.post(
+    "/profiling/requests",
+    summary="Turns profiling admin requests with the X-Profile header on or off",
+)
+async def set_request_profiling(enabled: bool):
+    profiler.profile_requests = enabled
+
+
+@router.get(
+    "/profiles",
+    response_model=list[RequestProfileResponse],
+    summary="Latest request profiles of this worker",
+)
+async def get_request_profiles():
+    return [
+        RequestProfileResponse(
+            id=profile.id,
+            method=profile.method,
+            path=profile.path,
+            created_at=profile.created_at,
+            duration=profile.duration,
+        )
+        for profile in profiler.request_profiles.values()
+    ]
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    summary="Downloads a request profile, open it with pstats or snakeviz",
+)
+async def download_request_profile(profile_id: str):
+    profile = profiler.get_request_profile(profile_id)
+    return Response(
+        profile.stats,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'},
+    )
+
+
+@router.get(
+    "/profiles/{profile_id}/summary",
+    response_class=PlainTextResponse,
+    summary="Slowest functions of a request profile",
+)
+async def get_request_profile_summary(
+    profile_id: str,
+    sort: ProfileSort = "cumulative",
+    limit: int = Query(30, ge=1, le=500),
+):
+    profile = profiler.get_request_profile(profile_id)
+    return profile.summary(sort, limit)
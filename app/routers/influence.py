@@ -1,6 +1,6 @@
 from typing import Annotated, Optional
 
-from fastapi import APIRouter, Cookie, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
 from app.db import Beatmap, InfluenceDBModel
@@ -11,9 +11,16 @@ from app.routers.activity import (
     ActivityUser,
     ActivityWebsocket,
 )
+from app.routers import request_key_builder
 from app.routers.osu_api import get_user_osu_parsed
-from app.utils.jwt import decode_jwt
+from app.utils.cache import cache, user_tag
+from app.utils.jwt import decode_user_token
 from app.utils.osu_requester import Requester
+from app.utils.rate_limit import influence_rate_limit
+
+# Influence writes invalidate them
+INFLUENCE_CACHE_EXPIRE = 24 * 60 * 60
+INFLUENCE_CACHE_NAMESPACE = "influence"
 
 router = APIRouter(prefix="/influence", tags=["influence"])
 
@@ -25,17 +32,12 @@ class InfluenceRequest(BaseModel):
     beatmaps: list[Beatmap] = []
 
 
-def decode_user_token(
-    user_token: Annotated[str, Cookie()],
-):
-    try:
-        return decode_jwt(user_token)
-
-    except Exception as ex:
-        raise HTTPException(status_code=401, detail=f"Invalid token {ex}")
-
-
-@router.post("", summary="Adds an influence.", response_model=InfluenceDBModel)
+@router.post(
+    "",
+    summary="Adds an influence.",
+    response_model=InfluenceDBModel,
+    dependencies=[Depends(influence_rate_limit)],
+)
 async def add_influence(
     influence_request: InfluenceRequest,
     user: Annotated[dict, Depends(decode_user_token)],
@@ -52,9 +54,7 @@ async def add_influence(
         type=influence_request.type,
         ranked=db_user["have_ranked_map"],
     )
-    user_osu = await get_user_osu_parsed(
-        requester, user["access_token"], influence.influenced_to
-    )
+    user_osu = await get_user_osu_parsed(requester, influence.influenced_to)
     # TODO do better error handling here
     if "error" in user_osu:
         raise HTTPException(status_code=404, detail="User not found on osu!")
@@ -78,11 +78,17 @@ async def add_influence(
     response_model_by_alias=False,
     summary="Get all influences of user",
 )
+@cache(
+    namespace=INFLUENCE_CACHE_NAMESPACE,
+    expire=INFLUENCE_CACHE_EXPIRE,
+    key_builder=request_key_builder,
+    tags=lambda kwargs: [user_tag(kwargs["user_id"])],
+)
 async def get_influences(
     _: Annotated[dict, Depends(decode_user_token)],
     user_id: int,
     mongo_db: AsyncMongoClient = Depends(get_mongo_db),
-):
+) -> list[InfluenceDBModel]:
     return await mongo_db.get_influences(user_id)
 
 
@@ -92,15 +98,25 @@ async def get_influences(
     response_model_by_alias=False,
     summary="Get all mentions of user, basically the opposite of influences",
 )
+@cache(
+    namespace=INFLUENCE_CACHE_NAMESPACE,
+    expire=INFLUENCE_CACHE_EXPIRE,
+    key_builder=request_key_builder,
+    tags=lambda kwargs: [user_tag(kwargs["user_id"])],
+)
 async def get_mentions(
     _: Annotated[dict, Depends(decode_user_token)],
     user_id: int,
     mongo_db: AsyncMongoClient = Depends(get_mongo_db),
-):
+) -> list[InfluenceDBModel]:
     return await mongo_db.get_mentions(user_id)
 
 
-@router.delete("/{influenced_to}", summary="Remove influence from the current user")
+@router.delete(
+    "/{influenced_to}",
+    summary="Remove influence from the current user",
+    dependencies=[Depends(influence_rate_limit)],
+)
 async def remove_influence(
     user: Annotated[dict, Depends(decode_user_token)],
     influenced_to: int,
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from fastapi_cache.decorator import cache
 
 from app.db.instance import get_mongo_db, AsyncMongoClient
+from app.routers import request_key_builder
+from app.utils.cache import cache, leaderboard_tag
+from app.utils.cache_warmer import record_leaderboard_access
 
-LEADERBOARD_CACHE_EXPIRE = 60
+# Influence changes invalidate the leaderboards, so this only bounds how long unused variants stay
+LEADERBOARD_CACHE_EXPIRE = 6 * 60 * 60
 LEADERBOARD_CACHE_NAMESPACE = "leaderboard"
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
@@ -28,8 +31,15 @@ class LeaderboardResponse(BaseModel):
     "",
     response_model=LeaderboardResponse,
     summary="Get top users which are most mentioned by others",
+    dependencies=[Depends(record_leaderboard_access)],
+)
+@cache(
+    namespace=LEADERBOARD_CACHE_NAMESPACE,
+    expire=LEADERBOARD_CACHE_EXPIRE,
+    # The default builder hashes the arguments, the mongo client's repr differs between workers
+    key_builder=request_key_builder,
+    tags=lambda kwargs: [leaderboard_tag(kwargs["country"])],
 )
-@cache(namespace=LEADERBOARD_CACHE_NAMESPACE, expire=LEADERBOARD_CACHE_EXPIRE)
 async def get_leaderboard(
     country: str = None,
     limit: int = None,
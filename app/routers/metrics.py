@@ -0,0 +1,27 @@
+import os
+
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from app.utils.metrics import stats_collector
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Several workers, aggregate what every one of them wrote
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        # Kept in memory, these are the stats of the worker answering the scrape
+        registry.register(stats_collector)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,11 +1,11 @@
-from typing import Annotated, Optional
+from typing import Optional
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Cookie, Request
-from fastapi_cache.decorator import cache
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 
+from app.config import settings
 from app.routers import request_key_builder
-from app.utils.jwt import decode_jwt
+from app.utils.cache import cache
 from app.utils.osu_requester import Requester
 
 OSU_API_BEATMAP_CACHE_EXPIRE = 12 * 60 * 60
@@ -97,13 +97,6 @@ class OsuSearchMapResponse(ConfiguredModel):
     beatmapsets: list[BaseBeatmapset]
 
 
-def get_access_token(
-    user_token: Annotated[str, Cookie()],
-):
-    user = decode_jwt(user_token)
-    return user["access_token"]
-
-
 @router.get(
     "/beatmap/{id}",
     response_model=BeatmapsetOsu,
@@ -116,17 +109,14 @@ def get_access_token(
 )
 async def get_beatmapset(
     id: int,
-    access_token: Annotated[str, Depends(get_access_token)],
     requester: Requester = Depends(Requester.get_instance),
     type: str | None = None,
 ) -> BeatmapsetOsu:
     if type == "beatmapset" or type is None:
-        return await get_beatmapset_osu_parsed(requester, access_token, id)
+        return await get_beatmapset_osu_parsed(requester, id)
     elif type == "beatmap":
-        beatmap = await get_beatmap_osu_parsed(requester, access_token, id)
-        return await get_beatmapset_osu_parsed(
-            requester, access_token, beatmap.beatmapset_id
-        )
+        beatmap = await get_beatmap_osu_parsed(requester, id)
+        return await get_beatmapset_osu_parsed(requester, beatmap.beatmapset_id)
     else:
         raise HTTPException(
             status_code=400,
@@ -144,10 +134,9 @@ async def get_beatmapset(
 )
 async def get_user(
     user_id: int,
-    access_token: Annotated[str, Depends(get_access_token)],
     requester: Requester = Depends(Requester.get_instance),
 ) -> UserOsu:
-    return await get_user_osu_parsed(requester, access_token, user_id)
+    return await get_user_osu_parsed(requester, user_id)
 
 
 @router.get(
@@ -162,10 +151,9 @@ async def get_user(
 )
 async def search(
     query: str,
-    access_token: Annotated[str, Depends(get_access_token)],
     requester: Requester = Depends(Requester.get_instance),
 ) -> OsuSearchResponse:
-    return await search_user_osu_parsed(requester, access_token, query)
+    return await search_user_osu_parsed(requester, query)
 
 
 @router.get(
@@ -179,44 +167,32 @@ async def search(
     key_builder=request_key_builder,
 )
 async def search_map(
-    access_token: Annotated[str, Depends(get_access_token)],
     request: Request,
     requester: Requester = Depends(Requester.get_instance),
 ) -> OsuSearchMapResponse:
-    return await search_map_osu_parsed(
-        requester, access_token, str(request.query_params)
-    )
+    return await search_map_osu_parsed(requester, str(request.query_params))
 
 
-async def get_beatmap_osu_parsed(
-    requester: Requester, access_token: str, beatmap_id: int
-):
-    beatmap_url = f"https://osu.ppy.sh/api/v2/beatmaps/{beatmap_id}"
-    auth_header = {"Authorization": f"Bearer {access_token}"}
-    return await requester.request("GET", BeatmapOsu, beatmap_url, auth_header)
+async def get_beatmap_osu_parsed(requester: Requester, beatmap_id: int):
+    beatmap_url = f"{settings.OSU_BASE_URL}/api/v2/beatmaps/{beatmap_id}"
+    return await requester.request("GET", BeatmapOsu, beatmap_url)
 
 
-async def get_beatmapset_osu_parsed(
-    requester: Requester, access_token: str, beatmapset_id: int
-):
-    beatmapset_url = f"https://osu.ppy.sh/api/v2/beatmapsets/{beatmapset_id}"
-    auth_header = {"Authorization": f"Bearer {access_token}"}
-    return await requester.request("GET", BeatmapsetOsu, beatmapset_url, auth_header)
+async def get_beatmapset_osu_parsed(requester: Requester, beatmapset_id: int):
+    beatmapset_url = f"{settings.OSU_BASE_URL}/api/v2/beatmapsets/{beatmapset_id}"
+    return await requester.request("GET", BeatmapsetOsu, beatmapset_url)
 
 
-async def get_user_osu_parsed(requester: Requester, access_token: str, user_id: int):
-    user_url = f"https://osu.ppy.sh/api/v2/users/{user_id}"
-    auth_header = {"Authorization": f"Bearer {access_token}"}
-    return await requester.request("GET", UserOsu, user_url, auth_header)
+async def get_user_osu_parsed(requester: Requester, user_id: int):
+    user_url = f"{settings.OSU_BASE_URL}/api/v2/users/{user_id}"
+    return await requester.request("GET", UserOsu, user_url)
 
 
-async def search_user_osu_parsed(requester: Requester, access_token: str, query: str):
-    search_url = f"https://osu.ppy.sh/api/v2/search/?mode=user&query={query}"
-    auth_header = {"Authorization": f"Bearer {access_token}"}
-    return await requester.request("GET", OsuSearchResponse, search_url, auth_header)
+async def search_user_osu_parsed(requester: Requester, query: str):
+    search_url = f"{settings.OSU_BASE_URL}/api/v2/search/?mode=user&query={query}"
+    return await requester.request("GET", OsuSearchResponse, search_url)
 
 
-async def search_map_osu_parsed(requester: Requester, access_token: str, query: str):
-    search_url = f"https://osu.ppy.sh/api/v2/beatmapsets/search?{query}"
-    auth_header = {"Authorization": f"Bearer {access_token}"}
-    return await requester.request("GET", OsuSearchMapResponse, search_url, auth_header)
+async def search_map_osu_parsed(requester: Requester, query: str):
+    search_url = f"{settings.OSU_BASE_URL}/api/v2/beatmapsets/search?{query}"
+    return await requester.request("GET", OsuSearchMapResponse, search_url)
@@ -1,14 +1,13 @@
 # Full osu! API response with caching
 # For ease of frontend development
 
-from typing import Annotated
-
 import aiohttp
-from fastapi import APIRouter, Depends, HTTPException, Cookie, Request
-from fastapi_cache.decorator import cache
+from fastapi import APIRouter, HTTPException, Request
 
+from app.config import settings
 from app.routers import request_key_builder
-from app.utils.jwt import decode_jwt
+from app.utils.cache import cache
+from app.utils.osu_requester import OsuTokenManager
 
 OSU_API_BEATMAP_CACHE_EXPIRE = 12 * 60 * 60
 OSU_API_USER_CACHE_EXPIRE = 3 * 60 * 60
@@ -18,11 +17,10 @@ OSU_API_CACHE_NAMESPACE = "osu_api"
 router = APIRouter(prefix="/osu_api_full", tags=["osu! API Full Response"])
 
 
-def get_access_token(
-    user_token: Annotated[str, Cookie()],
-):
-    user = decode_jwt(user_token)
-    return user["access_token"]
+async def get_access_token():
+    """Called by the handlers instead of being a dependency, so cached responses don't wait for the token."""
+    token_manager = await OsuTokenManager.get_instance()
+    return await token_manager.get_token()
 
 
 @router.get(
@@ -36,9 +34,9 @@ def get_access_token(
 )
 async def get_beatmapset(
     id: int,
-    access_token: Annotated[str, Depends(get_access_token)],
     type: str | None = None,
 ):
+    access_token = await get_access_token()
     if type == "beatmapset" or type is None:
         return await get_beatmapset_osu(access_token, id)
     elif type == "beatmap":
@@ -59,8 +57,8 @@ async def get_beatmapset(
 )
 async def get_user(
     user_id: int,
-    access_token: Annotated[str, Depends(get_access_token)],
 ):
+    access_token = await get_access_token()
     return await get_user_osu(access_token, user_id)
 
 
@@ -75,8 +73,8 @@ async def get_user(
 async def get_user_beatmap(
     beatmap_id: int,
     type: str,
-    access_token: Annotated[str, Depends(get_access_token)],
 ):
+    access_token = await get_access_token()
     return await get_user_beatmaps_osu(access_token, beatmap_id, type)
 
 
@@ -88,8 +86,8 @@ async def get_user_beatmap(
 )
 async def search(
     query: str,
-    access_token: Annotated[str, Depends(get_access_token)],
 ):
+    access_token = await get_access_token()
     return await search_user_osu(access_token, query)
 
 
@@ -100,14 +98,14 @@ async def search(
     key_builder=request_key_builder,
 )
 async def search_map(
-    access_token: Annotated[str, Depends(get_access_token)],
     request: Request,
 ):
+    access_token = await get_access_token()
     return await search_map_osu(access_token, str(request.query_params))
 
 
 async def get_beatmap_osu(access_token: str, beatmap_id: int):
-    beatmap_url = f"https://osu.ppy.sh/api/v2/beatmaps/{beatmap_id}"
+    beatmap_url = f"{settings.OSU_BASE_URL}/api/v2/beatmaps/{beatmap_id}"
     auth_header = {"Authorization": f"Bearer {access_token}"}
     async with aiohttp.ClientSession(headers=auth_header) as session:
         async with session.get(beatmap_url) as response:
@@ -115,7 +113,7 @@ async def get_beatmap_osu(access_token: str, beatmap_id: int):
 
 
 async def get_beatmapset_osu(access_token: str, beatmapset_id: int):
-    beatmapset_url = f"https://osu.ppy.sh/api/v2/beatmapsets/{beatmapset_id}"
+    beatmapset_url = f"{settings.OSU_BASE_URL}/api/v2/beatmapsets/{beatmapset_id}"
     auth_header = {"Authorization": f"Bearer {access_token}"}
     async with aiohttp.ClientSession(headers=auth_header) as session:
         async with session.get(beatmapset_url) as response:
@@ -123,7 +121,7 @@ async def get_beatmapset_osu(access_token: str, beatmapset_id: int):
 
 
 async def get_user_osu(access_token: str, user_id: int):
-    user_url = f"https://osu.ppy.sh/api/v2/users/{user_id}"
+    user_url = f"{settings.OSU_BASE_URL}/api/v2/users/{user_id}"
     auth_header = {"Authorization": f"Bearer {access_token}"}
     async with aiohttp.ClientSession(headers=auth_header) as session:
         async with session.get(user_url) as response:
@@ -131,8 +129,7 @@ async def get_user_osu(access_token: str, user_id: int):
 
 
 async def get_user_beatmaps_osu(access_token: str, user_id: int, type: str):
-    user_maps_url = f"""https://osu.ppy.sh/api/v2/users
-                      /{user_id}/beatmapsets/{type}"""
+    user_maps_url = f"{settings.OSU_BASE_URL}/api/v2/users/{user_id}/beatmapsets/{type}"
     auth_header = {"Authorization": f"Bearer {access_token}"}
     async with aiohttp.ClientSession(headers=auth_header) as session:
         async with session.get(user_maps_url) as response:
@@ -140,7 +137,7 @@ async def get_user_beatmaps_osu(access_token: str, user_id: int, type: str):
 
 
 async def search_user_osu(access_token: str, query: str):
-    search_url = f"https://osu.ppy.sh/api/v2/search/?mode=user&query={query}"
+    search_url = f"{settings.OSU_BASE_URL}/api/v2/search/?mode=user&query={query}"
     auth_header = {"Authorization": f"Bearer {access_token}"}
     async with aiohttp.ClientSession(headers=auth_header) as session:
         async with session.get(search_url) as response:
@@ -148,7 +145,7 @@ async def search_user_osu(access_token: str, query: str):
 
 
 async def search_map_osu(access_token: str, query: str):
-    search_url = f"https://osu.ppy.sh/api/v2/beatmapsets/search?{query}"
+    search_url = f"{settings.OSU_BASE_URL}/api/v2/beatmapsets/search?{query}"
     auth_header = {"Authorization": f"Bearer {access_token}"}
     async with aiohttp.ClientSession(headers=auth_header) as session:
         async with session.get(search_url) as response:
@@ -6,8 +6,16 @@ from pydantic import BaseModel
 
 from app.db import Beatmap, User
 from app.db.instance import get_mongo_db, AsyncMongoClient
+from app.routers import request_key_builder
 from app.routers.activity import ActivityDetails, ActivityType, ActivityWebsocket
+from app.utils.cache import cache, user_tag
+from app.utils.cache_warmer import record_profile_access
 from app.utils.jwt import decode_user_token
+from app.utils.rate_limit import profile_rate_limit
+
+# Writes to the user invalidate it
+USER_CACHE_EXPIRE = 24 * 60 * 60
+USER_CACHE_NAMESPACE = "users"
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -36,15 +44,28 @@ async def get_user_details(
 
 
 @router.get(
-    "/{user_id}", response_model=User, summary="Gets user details from database"
+    "/{user_id}",
+    response_model=User,
+    summary="Gets user details from database",
+    dependencies=[Depends(record_profile_access)],
+)
+@cache(
+    namespace=USER_CACHE_NAMESPACE,
+    expire=USER_CACHE_EXPIRE,
+    key_builder=request_key_builder,
+    tags=lambda kwargs: [user_tag(kwargs["user_id"])],
 )
 async def get_user_by_id(
     user_id: int, mongo_db: AsyncMongoClient = Depends(get_mongo_db)
-):
+) -> User:
     return await get_user_data(user_id, mongo_db)
 
 
-@router.post("/bio", summary="Updates user bio")
+@router.post(
+    "/bio",
+    summary="Updates user bio",
+    dependencies=[Depends(profile_rate_limit)],
+)
 async def update_user_bio(
     user: Annotated[dict, Depends(decode_user_token)],
     bio: RequestBio,
@@ -59,7 +80,11 @@ async def update_user_bio(
     return await mongo_db.update_user_bio(user["id"], bio.bio)
 
 
-@router.post("/add_beatmap", summary="Add beatmap to user")
+@router.post(
+    "/add_beatmap",
+    summary="Add beatmap to user",
+    dependencies=[Depends(profile_rate_limit)],
+)
 async def add_beatmap_to_user(
     user: Annotated[dict, Depends(decode_user_token)],
     beatmap: Beatmap,
@@ -79,6 +104,7 @@ async def add_beatmap_to_user(
 @router.delete(
     "/remove_beatmap/{beatmap_id_type}/{beatmap_id}",
     summary="Remove beatmap from user, type can be 'set' or 'diff'",
+    dependencies=[Depends(profile_rate_limit)],
 )
 async def remove_beatmap_from_user(
     user: Annotated[dict, Depends(decode_user_token)],
@@ -102,7 +128,9 @@ async def remove_beatmap_from_user(
 
 
 @router.post(
-    "/influence-order", summary="Set the custom influence order for the current user"
+    "/influence-order",
+    summary="Set the custom influence order for the current user",
+    dependencies=[Depends(profile_rate_limit)],
 )
 async def save_custom_order(
     user: Annotated[dict, Depends(decode_user_token)],
@@ -0,0 +1,132 @@
+"""
+Compares how much a cached osu! response costs in redis with the old and the current encoding.
+
+Old: fastapi-cache's JsonCoder value under a key with the raw path and query.
+Current: CacheEntry (header + compact json, gzipped above CACHE_GZIP_MIN_BYTES) under a hashed key.
+
+Values are the recorded osu! responses in `app/test/data`. With a reachable `REDIS_URL` the sizes are
+measured with `MEMORY USAGE`, otherwise the raw key + value bytes are reported.
+
+    python -m app.test.bench_cache_encoding
+"""
+
+import asyncio
+import json
+import os
+import uuid
+
+from redis import asyncio as aioredis
+from starlette.requests import Request
+
+from app.config import settings
+from app.routers import request_key_builder
+from app.utils.cache import CacheEntry
+
+NAMESPACE = "fastapi-cache:osu_api"
+SAMPLE_REQUESTS = [
+    ("/osu_api_full/user/3953470", ""),
+    ("/osu_api_full/beatmap/2117273", "type=beatmap"),
+    (
+        "/osu_api/search_map",
+        "q=the+big+black&nsfw=true&s=ranked&m=0&sort=plays_desc&page=2",
+    ),
+]
+
+
+def old_key(path: str, query: str) -> str:
+    request = make_request(path, query)
+    return ":".join(
+        [
+            NAMESPACE,
+            request.method.lower(),
+            request.url.path,
+            repr(sorted(request.query_params.items())),
+        ]
+    )
+
+
+def new_key(path: str, query: str) -> str:
+    return request_key_builder(None, NAMESPACE, request=make_request(path, query))
+
+
+def make_request(path: str, query: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": query.encode(),
+            "headers": [],
+        }
+    )
+
+
+def old_value(data) -> bytes:
+    return json.dumps(data).encode()
+
+
+def new_value(data) -> bytes:
+    body = json.dumps(data, separators=(",", ":")).encode()
+    compress = (
+        settings.CACHE_GZIP_RESPONSES and len(body) >= settings.CACHE_GZIP_MIN_BYTES
+    )
+    return CacheEntry.create(body, expire=3600, compress=compress).encode()
+
+
+async def memory_usage(redis, key: str, value: bytes) -> int:
+    if redis is None:
+        return len(key) + len(value)
+    await redis.set(key, value)
+    try:
+        return await redis.memory_usage(key, samples=0)
+    finally:
+        await redis.delete(key)
+
+
+async def connect_redis():
+    try:
+        redis = aioredis.from_url(settings.REDIS_URL)
+        await redis.ping()
+        return redis
+    except Exception:
+        return None
+
+
+async def main():
+    redis = await connect_redis()
+    unit = "redis MEMORY USAGE" if redis is not None else "key + value bytes"
+    print(f"Sizes in {unit}\n")
+
+    print(f"{'request':<40} {'old key':>8} {'new key':>8}")
+    for path, query in SAMPLE_REQUESTS:
+        print(
+            f"{path:<40} {len(old_key(path, query)):>8} {len(new_key(path, query)):>8}"
+        )
+
+    print(f"\n{'fixture':<24} {'old':>10} {'new':>10} {'ratio':>7}")
+    total_old = total_new = 0
+    for file_name in sorted(os.listdir("app/test/data")):
+        with open(os.path.join("app/test/data", file_name), "rb") as json_file:
+            data = json.load(json_file)
+        key_suffix = uuid.uuid4().hex
+        old = await memory_usage(
+            redis, f"{NAMESPACE}:get:/bench/{key_suffix}:[]", old_value(data)
+        )
+        new = await memory_usage(
+            redis,
+            new_key("/bench", key_suffix),
+            new_value(data),
+        )
+        total_old += old
+        total_new += new
+        print(f"{file_name[:24]:<24} {old:>10} {new:>10} {new / old:>7.2f}")
+    print(
+        f"{'total':<24} {total_old:>10} {total_new:>10} {total_new / total_old:>7.2f}"
+    )
+
+    if redis is not None:
+        await redis.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
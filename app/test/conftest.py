@@ -14,6 +14,7 @@ from app.utils.osu_requester import Requester
 from ..main import app
 from app.test.helpers import get_authentication_jwt
 from app.config import settings
+from app.db.activity_writer import ActivityWriter
 from app.db.instance import close_mongo_client, get_mongo_db, start_mongo_client
 
 
@@ -53,8 +54,12 @@ async def lifespan_manager():
         requester = await Requester.get_instance()
         requester.set_test_path("app/test/data")
         start_mongo_client(settings.MONGO_URL)
+        await get_mongo_db().setup_activity_collection(
+            settings.ACTIVITY_COLLECTION_MAX_BYTES
+        )
         FastAPICache.init(InMemoryBackend())
         yield
+        await ActivityWriter.close_instance()
         close_mongo_client()
         await requester.close()
 
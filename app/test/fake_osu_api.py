@@ -0,0 +1,209 @@
+"""
+Stand-in for the osu! API to load test the backend without network access.
+
+Serves recorded responses from `app/test/data` when the exact url was recorded,
+otherwise generates deterministic synthetic data from the requested ids.
+Latency, error rate and rate limiting are configured with `FAKE_OSU_` env variables.
+
+Run it next to the backend:
+    uvicorn app.test.fake_osu_api:app --port 8001
+    OSU_BASE_URL=http://localhost:8001 uvicorn app.main:app
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+# Fixtures are keyed by the urls we request in production
+RECORDED_BASE_URL = "https://osu.ppy.sh"
+
+
+class FakeOsuSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="FAKE_OSU_")
+
+    LATENCY_MS: float = 100
+    LATENCY_JITTER_MS: float = 50
+    # Fraction of requests answered with a 5xx
+    ERROR_RATE: float = 0.0
+    # Requests per minute per token before answering 429, 0 disables it
+    RATE_LIMIT_PER_MINUTE: int = 0
+    FIXTURE_PATH: str = "app/test/data"
+    ME_USER_ID: int = 3953470
+    SEED: int | None = None
+
+
+fake_settings = FakeOsuSettings()
+rng = random.Random(fake_settings.SEED)
+# token -> (window start, request count)
+rate_limit_windows: dict[str, tuple[float, int]] = {}
+
+app = FastAPI(title="Fake osu! API")
+
+
+def is_rate_limited(token: str) -> bool:
+    if fake_settings.RATE_LIMIT_PER_MINUTE <= 0:
+        return False
+    now = time.monotonic()
+    window_start, count = rate_limit_windows.get(token, (now, 0))
+    if now - window_start >= 60:
+        window_start, count = now, 0
+    rate_limit_windows[token] = (window_start, count + 1)
+    return count >= fake_settings.RATE_LIMIT_PER_MINUTE
+
+
+@app.middleware("http")
+async def simulate_upstream(request: Request, call_next):
+    jitter = rng.uniform(-1, 1) * fake_settings.LATENCY_JITTER_MS
+    await asyncio.sleep(max(fake_settings.LATENCY_MS + jitter, 0) / 1000)
+
+    token = request.headers.get("Authorization", "")
+    if is_rate_limited(token):
+        return JSONResponse(
+            {"error": "Too Many Attempts."},
+            status_code=429,
+            headers={"Retry-After": "60"},
+        )
+    if rng.random() < fake_settings.ERROR_RATE:
+        return JSONResponse(
+            {"error": "Simulated upstream error"}, status_code=rng.choice([500, 503])
+        )
+
+    recorded = load_recorded(request)
+    if recorded is not None:
+        return Response(content=recorded, media_type="application/json")
+    return await call_next(request)
+
+
+def load_recorded(request: Request) -> bytes | None:
+    url = f"{RECORDED_BASE_URL}{request.url.path}"
+    if request.url.query:
+        url += f"?{request.url.query}"
+    url_hash = hashlib.sha256(url.encode()).hexdigest()
+    file_path = os.path.join(
+        fake_settings.FIXTURE_PATH, f"{request.method}-{url_hash}.json"
+    )
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "rb") as json_file:
+        return json_file.read()
+
+
+def fake_user(user_id: int):
+    user_rng = random.Random(user_id)
+    return {
+        "id": user_id,
+        "username": f"user{user_id}",
+        "avatar_url": f"https://a.ppy.sh/{user_id}",
+        "country": {"code": "TR", "name": "Turkey"},
+        "groups": [],
+        "previous_usernames": [],
+        "ranked_and_approved_beatmapset_count": user_rng.randint(0, 20),
+        "ranked_beatmapset_count": user_rng.randint(0, 20),
+        "nominated_beatmapset_count": user_rng.randint(0, 5),
+        "guest_beatmapset_count": user_rng.randint(0, 10),
+        "loved_beatmapset_count": user_rng.randint(0, 3),
+        "graveyard_beatmapset_count": user_rng.randint(0, 50),
+        "pending_beatmapset_count": user_rng.randint(0, 5),
+    }
+
+
+# Beatmap ids are derived from their set id, so beatmap -> beatmapset lookups stay consistent
+BEATMAPS_PER_SET = 8
+
+
+def fake_beatmap(beatmap_id: int):
+    beatmap_rng = random.Random(beatmap_id)
+    return {
+        "id": beatmap_id,
+        "beatmapset_id": beatmap_id // BEATMAPS_PER_SET,
+        "difficulty_rating": round(beatmap_rng.uniform(1, 8), 2),
+        "mode": "osu",
+        "version": f"Difficulty {beatmap_id % BEATMAPS_PER_SET}",
+    }
+
+
+def fake_beatmapset(beatmapset_id: int):
+    set_rng = random.Random(beatmapset_id)
+    creator_id = set_rng.randint(1, 30_000_000)
+    first_beatmap = beatmapset_id * BEATMAPS_PER_SET
+    beatmap_count = set_rng.randint(1, BEATMAPS_PER_SET)
+    return {
+        "id": beatmapset_id,
+        "title": f"Song {beatmapset_id}",
+        "artist": f"Artist {set_rng.randint(1, 1000)}",
+        "covers": {
+            "cover": f"https://assets.ppy.sh/beatmaps/{beatmapset_id}/cover.jpg"
+        },
+        "creator": f"user{creator_id}",
+        "user_id": creator_id,
+        "beatmaps": [
+            fake_beatmap(beatmap_id)
+            for beatmap_id in range(first_beatmap, first_beatmap + beatmap_count)
+        ],
+        "related_users": [
+            {
+                "username": f"user{creator_id}",
+                "avatar_url": f"https://a.ppy.sh/{creator_id}",
+            }
+        ],
+    }
+
+
+@app.post("/oauth/token")
+async def token():
+    return {
+        "token_type": "Bearer",
+        "expires_in": 86400,
+        "access_token": f"fake-{uuid.uuid4().hex}",
+        "refresh_token": f"fake-refresh-{uuid.uuid4().hex}",
+    }
+
+
+@app.get("/api/v2/me")
+async def me():
+    return fake_user(fake_settings.ME_USER_ID)
+
+
+@app.get("/api/v2/users/{user_id}")
+async def user(user_id: int):
+    return fake_user(user_id)
+
+
+@app.get("/api/v2/users/{user_id}/beatmapsets/{type}")
+async def user_beatmapsets(user_id: int, type: str):
+    user_rng = random.Random(user_id)
+    return [fake_beatmapset(user_rng.randint(1, 2_000_000)) for _ in range(5)]
+
+
+@app.get("/api/v2/beatmaps/{beatmap_id}")
+async def beatmap(beatmap_id: int):
+    return fake_beatmap(beatmap_id)
+
+
+@app.get("/api/v2/beatmapsets/search")
+async def search_beatmapsets(q: str = ""):
+    query_rng = random.Random(q)
+    return {
+        "beatmapsets": [
+            fake_beatmapset(query_rng.randint(1, 2_000_000)) for _ in range(50)
+        ]
+    }
+
+
+@app.get("/api/v2/beatmapsets/{beatmapset_id}")
+async def beatmapset(beatmapset_id: int):
+    return fake_beatmapset(beatmapset_id)
+
+
+@app.get("/api/v2/search/")
+async def search(mode: str = "all", query: str = ""):
+    query_rng = random.Random(query)
+    users = [fake_user(query_rng.randint(1, 30_000_000)) for _ in range(20)]
+    return {"user": {"data": users, "total": len(users)}}
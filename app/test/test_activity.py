@@ -1,7 +1,25 @@
+import asyncio
+import datetime
+
+from bson import ObjectId
+from fakeredis import FakeAsyncRedis
+import msgpack
+from prometheus_client import REGISTRY
 import pytest
 from httpx_ws import aconnect_ws
 
-from app.routers.activity import ActivityWebsocket
+from app.config import settings
+from app.db.activity_writer import ActivityWriter
+from app.db.monitoring import BACKGROUND_ROUTE
+from app.db.instance import get_mongo_db
+from app.routers.activity import (
+    ACTIVITY_RECENT_KEY,
+    ActivityDetails,
+    ActivityQueue,
+    ActivitySubscription,
+    ActivityType,
+    ActivityWebsocket,
+)
 from app.test.helpers import add_fake_user_to_db
 
 
@@ -136,3 +154,383 @@ async def test_activity_endpoint(test_client, mongo_db, headers, test_user_id):
     assert len(response) == 2
     assert_add_influence(response[0], 418699)
     assert_remove_influence(response[1], 418699)
+
+
+@pytest.mark.asyncio
+async def test_activity_history(test_client, mongo_db, headers, test_user_id):
+    response = await test_client.post(
+        "users/add_beatmap",
+        json={"id": 131891, "is_beatmapset": False},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    response = await test_client.delete(
+        "users/remove_beatmap/diff/131891", headers=headers
+    )
+    assert response.status_code == 200
+    # Activities are written behind, make sure they are in the database
+    await (await ActivityWriter.get_instance()).flush()
+
+    response = await test_client.get(f"activity/user/{test_user_id}?limit=2")
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page) == 2
+    assert all(data["user"]["id"] == test_user_id for data in first_page)
+    # Newest first
+    assert first_page[0]["id"] > first_page[1]["id"]
+
+    response = await test_client.get(
+        f"activity/user/{test_user_id}?limit=2&before={first_page[0]['id']}"
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == first_page[1]["id"]
+
+    response = await test_client.get(f"activity?limit=5&before={first_page[1]['id']}")
+    assert response.status_code == 200
+    assert all(data["id"] < first_page[1]["id"] for data in response.json())
+
+    # Pages are oldest first, like the latest activities without parameters
+    response = await test_client.get("activity?limit=2")
+    assert response.status_code == 200
+    latest_page = response.json()
+    assert latest_page[0]["id"] < latest_page[1]["id"]
+    response = await test_client.get(f"activity?limit=2&before={latest_page[0]['id']}")
+    assert response.status_code == 200
+    assert response.json()[-1]["id"] < latest_page[0]["id"]
+
+    response = await test_client.get("activity?before=not-an-id")
+    assert response.status_code == 400
+
+
+def test_activity_queue_since():
+    queue = ActivityQueue(3)
+    for seq in range(1, 6):
+        activity = {
+            "seq": seq,
+            "type": "EDIT_BIO",
+            "user": {"id": seq},
+            "details": {"influenced_to": None},
+        }
+        queue.push(activity, str(seq))
+
+    assert queue.since(5) == "[]"
+    assert queue.since(3) == "[4,5]"
+    assert queue.since(2) == "[3,4,5]"
+    # 2 was evicted, or the client is from an unknown sequence
+    assert queue.since(1) is None
+    assert queue.since(6) is None
+
+    packed = msgpack.unpackb(queue.since(3, binary=True))
+    assert [activity["seq"] for activity in packed] == [4, 5]
+    packed = msgpack.unpackb(queue.snapshot(binary=True))
+    assert [activity["seq"] for activity in packed] == [3, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_activity_websocket_resume(test_client, mongo_db, headers):
+    websocket_manager = await ActivityWebsocket.get_instance()
+    websocket_manager.clear_queue()
+
+    response = await test_client.post(
+        "users/bio", json={"bio": "test"}, headers=headers
+    )
+    assert response.status_code == 200
+    async with aconnect_ws("ws://test/ws", test_client) as ws:
+        (last_seen,) = await ws.receive_json()
+
+    response = await test_client.post(
+        "users/add_beatmap",
+        json={"id": 131891, "is_beatmapset": False},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    async with aconnect_ws(f"ws://test/ws?since={last_seen['seq']}", test_client) as ws:
+        response = await ws.receive_json()
+        assert len(response) == 1
+        assert response[0]["seq"] > last_seen["seq"]
+        assert_add_beatmap(response[0], {"id": 131891, "is_beatmapset": False})
+
+
+@pytest.mark.asyncio
+async def test_activity_websocket_msgpack(test_client, mongo_db, headers):
+    websocket_manager = await ActivityWebsocket.get_instance()
+    websocket_manager.clear_queue()
+
+    async with aconnect_ws("ws://test/ws", test_client, subprotocols=["msgpack"]) as ws:
+        assert ws.subprotocol == "msgpack"
+        assert msgpack.unpackb(await ws.receive_bytes()) == []
+
+        response = await test_client.post(
+            "users/bio", json={"bio": "test"}, headers=headers
+        )
+        assert response.status_code == 200
+        assert_edit_bio(msgpack.unpackb(await ws.receive_bytes()), "test")
+
+
+def test_activity_subscription_matches():
+    activity = {
+        "type": "ADD_INFLUENCE",
+        "user": {"id": 1, "country": "TR"},
+        "details": {"influenced_to": {"id": 2}},
+    }
+    subscription = ActivitySubscription(user_ids={2}, groups={"INFLUENCE_ADD"})
+    assert subscription.matches(activity)
+    assert subscription.index_keys() == [("user", 2)]
+    assert not ActivitySubscription(user_ids={3}).matches(activity)
+    assert not ActivitySubscription(types={"EDIT_BIO"}).matches(activity)
+    assert not ActivitySubscription(user_ids={1}, countries={"US"}).matches(activity)
+    assert ActivitySubscription().is_unfiltered()
+
+
+@pytest.mark.asyncio
+async def test_activity_websocket_subscription(test_client, mongo_db, headers):
+    websocket_manager = await ActivityWebsocket.get_instance()
+    websocket_manager.clear_queue()
+
+    async with aconnect_ws("ws://test/ws", test_client) as ws:
+        assert await ws.receive_json() == []
+        await ws.send_json({"types": ["ADD_BEATMAP"]})
+        assert await ws.receive_json() == []
+
+        response = await test_client.post(
+            "users/bio", json={"bio": "test"}, headers=headers
+        )
+        assert response.status_code == 200
+        response = await test_client.post(
+            "users/add_beatmap",
+            json={"id": 131891, "is_beatmapset": False},
+            headers=headers,
+        )
+        assert response.status_code == 200
+
+        # The bio edit is filtered out
+        response = await ws.receive_json()
+        assert_add_beatmap(response, {"id": 131891, "is_beatmapset": False})
+
+
+@pytest.mark.asyncio
+async def test_activity_tail_delivers_late_writes(lifespan_manager, mongo_db):
+    await ActivityWebsocket.close_instance()
+    websocket_manager = await ActivityWebsocket.get_instance()
+    await websocket_manager.start_feed("mongo", None)
+
+    def make_activity(activity_id: ObjectId, seq: int):
+        return {
+            "_id": activity_id,
+            "seq": seq,
+            "type": "EDIT_BIO",
+            "user": {"id": seq, "country": "TR"},
+            "datetime": datetime.datetime.now().isoformat(),
+            "details": {"influenced_to": None},
+        }
+
+    # Another worker's batch with an older id is written after a newer one
+    older_id, newer_id = ObjectId(), ObjectId()
+    try:
+        await mongo_db.save_activities([make_activity(newer_id, 1_000_001)])
+        await mongo_db.save_activities([make_activity(older_id, 1_000_002)])
+
+        for _ in range(50):
+            if {str(older_id), str(newer_id)} <= websocket_manager.activity_queue.ids:
+                break
+            await asyncio.sleep(0.1)
+        assert str(newer_id) in websocket_manager.activity_queue.ids
+        assert str(older_id) in websocket_manager.activity_queue.ids
+    finally:
+        await ActivityWebsocket.close_instance()
+
+
+@pytest.mark.asyncio
+async def test_setup_activity_collection_concurrently(mongo_db):
+    # Every worker sets it up on startup
+    await asyncio.gather(
+        *(
+            mongo_db.setup_activity_collection(settings.ACTIVITY_COLLECTION_MAX_BYTES)
+            for _ in range(4)
+        )
+    )
+    assert await mongo_db.is_activity_collection_capped()
+
+
+@pytest.mark.asyncio
+async def test_setup_activity_collection_only_converts_when_asked(
+    mongo_db, monkeypatch
+):
+    collection = mongo_db.main_db.get_collection("ActivityUncappedTest")
+    await collection.drop()
+    await collection.insert_one({"type": "EDIT_BIO"})
+    monkeypatch.setattr(mongo_db, "activity_collection", collection)
+    try:
+        with pytest.raises(RuntimeError):
+            await mongo_db.setup_activity_collection(1024 * 1024)
+        assert not await mongo_db.is_activity_collection_capped()
+
+        await mongo_db.setup_activity_collection(1024 * 1024, convert=True)
+        assert await mongo_db.is_activity_collection_capped()
+    finally:
+        await collection.drop()
+
+
+@pytest.mark.asyncio
+async def test_activity_writer_keeps_batch_on_unexpected_error(
+    lifespan_manager, monkeypatch
+):
+    async def fail(activities):
+        raise RuntimeError("boom")
+
+    activity_writer = await ActivityWriter.get_instance()
+    await activity_writer.flush()
+    monkeypatch.setattr(get_mongo_db(), "save_activities", fail)
+    activity_writer.add(
+        {
+            "id": str(ObjectId()),
+            "seq": 1,
+            "type": "EDIT_BIO",
+            "user": {"id": 1, "country": "TR"},
+            "datetime": datetime.datetime.now().isoformat(),
+            "details": {"influenced_to": None},
+        }
+    )
+    activity_writer.batch_ready.set()
+    await asyncio.sleep(0.1)
+
+    assert len(activity_writer.buffer) == 1
+    assert not activity_writer.flush_task.done()
+
+    monkeypatch.undo()
+    await activity_writer.flush()
+    assert not activity_writer.buffer
+
+
+@pytest.mark.asyncio
+async def test_activity_writer_close_waits_for_running_insert(
+    lifespan_manager, monkeypatch
+):
+    mongo_db = get_mongo_db()
+    save_activities = mongo_db.save_activities
+    saved = []
+
+    async def slow_save(activities):
+        await asyncio.sleep(0.2)
+        await save_activities(activities)
+        saved.extend(activities)
+
+    activity_writer = await ActivityWriter.get_instance()
+    await activity_writer.flush()
+    monkeypatch.setattr(mongo_db, "save_activities", slow_save)
+    activity_writer.add(
+        {
+            "id": str(ObjectId()),
+            "seq": 1,
+            "type": "EDIT_BIO",
+            "user": {"id": 1, "country": "TR"},
+            "datetime": datetime.datetime.now().isoformat(),
+            "details": {"influenced_to": None},
+        }
+    )
+    activity_writer.batch_ready.set()
+    # Closed while the insert is running
+    await asyncio.sleep(0.05)
+    await ActivityWriter.close_instance()
+
+    assert len(saved) == 1
+
+
+async def start_worker(redis) -> ActivityWebsocket:
+    """A separate ActivityWebsocket, like the one of another worker process."""
+    ActivityWebsocket._instance = None
+    worker = await ActivityWebsocket.get_instance()
+    ActivityWebsocket._instance = None
+    await worker.start_feed("redis", redis)
+    worker.clear_queue()
+    return worker
+
+
+@pytest.mark.asyncio
+async def test_activity_fan_out_between_workers(lifespan_manager):
+    await ActivityWebsocket.close_instance()
+    redis = FakeAsyncRedis()
+    workers = [await start_worker(redis), await start_worker(redis)]
+    user = {"id": 1, "username": "test", "avatar_url": "test", "country": "TR"}
+    try:
+        # The same bio edit reaches both workers at once, only one of them may accept it
+        await asyncio.gather(
+            *(
+                worker.collect_acitivity(
+                    ActivityType.EDIT_BIO, user, ActivityDetails(description="hi")
+                )
+                for worker in workers
+            )
+        )
+        await workers[0].collect_acitivity(
+            ActivityType.ADD_BEATMAP,
+            user,
+            ActivityDetails(beatmap={"id": 131891, "is_beatmapset": False}),
+        )
+
+        for _ in range(50):
+            if all(len(worker.activity_queue) == 2 for worker in workers):
+                break
+            await asyncio.sleep(0.1)
+        for worker in workers:
+            activities = [entry[0] for entry in worker.activity_queue.activities]
+            assert [activity["type"] for activity in activities] == [
+                "EDIT_BIO",
+                "ADD_BEATMAP",
+            ]
+        assert await redis.llen(ACTIVITY_RECENT_KEY) == 2
+    finally:
+        for worker in workers:
+            await worker.close()
+        await redis.close()
+
+
+@pytest.mark.asyncio
+async def test_activity_websocket_heartbeat_keeps_listening_clients(
+    test_client, headers, monkeypatch
+):
+    monkeypatch.setattr(settings, "ACTIVITY_HEARTBEAT_INTERVAL", 0.1)
+    await ActivityWebsocket.close_instance()
+    websocket_manager = await ActivityWebsocket.get_instance()
+
+    # Clients only listen, they never send anything
+    async with aconnect_ws("ws://test/ws", test_client) as ws:
+        await ws.receive_json()
+        await asyncio.sleep(0.3)
+        assert len(websocket_manager.connections) == 1
+
+        response = await test_client.post(
+            "users/bio", json={"bio": "heartbeat"}, headers=headers
+        )
+        assert response.status_code == 200
+        assert_edit_bio(await ws.receive_json(), "heartbeat")
+
+    await ActivityWebsocket.close_instance()
+
+
+@pytest.mark.asyncio
+async def test_activity_writes_are_counted_as_background(test_client, headers):
+    def insert_count(route: str) -> float:
+        labels = {"command": "insert", "collection": "Activity", "route": route}
+        return REGISTRY.get_sample_value("mongo_command_seconds_count", labels) or 0
+
+    await ActivityWriter.close_instance()
+    websocket_manager = await ActivityWebsocket.get_instance()
+    websocket_manager.clear_queue()
+    background_inserts = insert_count(BACKGROUND_ROUTE)
+
+    # The writer is started by this request
+    response = await test_client.post(
+        "users/bio", json={"bio": "background"}, headers=headers
+    )
+    assert response.status_code == 200
+    activity_writer = await ActivityWriter.get_instance()
+    activity_writer.batch_ready.set()
+    for _ in range(50):
+        if insert_count(BACKGROUND_ROUTE) > background_inserts:
+            break
+        await asyncio.sleep(0.1)
+
+    assert insert_count(BACKGROUND_ROUTE) > background_inserts
+    assert insert_count("/users/bio") == 0
@@ -0,0 +1,193 @@
+import asyncio
+import time
+
+from fakeredis import FakeAsyncRedis
+from fastapi import FastAPI, HTTPException
+from fastapi_cache import FastAPICache
+from httpx import ASGITransport, AsyncClient
+from starlette.requests import Request
+
+from app.config import settings
+from app.routers import request_key_builder
+from app.utils.cache import (
+    CACHE_TAG_KEY,
+    CacheEntry,
+    LocalLRUCache,
+    TwoTierBackend,
+    cache,
+    invalidate_tags,
+    set_tagged,
+)
+from app.utils.circuit_breaker import CircuitOpenError
+from app.utils.jwt import VerifiedTokenCache
+
+
+def test_local_cache_evicts_least_recently_used_by_size():
+    local = LocalLRUCache(max_bytes=10, ttl=30)
+    local.set("a", b"1234")
+    local.set("b", b"1234")
+    # Touch "a" so "b" becomes the least recently used entry
+    assert local.get("a")[1] == b"1234"
+    local.set("c", b"1234")
+
+    assert local.get("b") == (0, None)
+    assert local.get("a")[1] == b"1234"
+    assert local.get("c")[1] == b"1234"
+    assert local.size == 8
+
+
+def test_local_cache_reports_remote_ttl():
+    local = LocalLRUCache(max_bytes=10, ttl=30)
+    local.set("a", b"1", ttl=600)
+    ttl, value = local.get("a")
+    assert value == b"1"
+    assert 599 <= ttl <= 600
+
+    local.set("b", b"1", ttl=-1)
+    assert local.get("b") == (-1, b"1")
+
+
+def test_local_cache_clear_by_prefix():
+    local = LocalLRUCache(max_bytes=100, ttl=30)
+    local.set("fastapi-cache:osu_api:a", b"1")
+    local.set("fastapi-cache:leaderboard:a", b"1")
+    assert local.clear(prefix="fastapi-cache:osu_api:") == 1
+    assert local.get("fastapi-cache:leaderboard:a")[1] == b"1"
+
+
+def test_verified_token_cache_drops_expired_tokens():
+    tokens = VerifiedTokenCache(max_size=2)
+    tokens.set("a", {"id": 1, "exp": time.time() + 60})
+    tokens.set("b", {"id": 2, "exp": time.time() - 1})
+    assert tokens.get("a") == {"id": 1, "exp": tokens.entries["a"][0]}
+    assert tokens.get("b") is None
+    assert len(tokens) == 1
+
+    tokens.set("c", {"id": 3})
+    tokens.set("d", {"id": 4})
+    assert tokens.get("a") is None
+    assert tokens.stats.hits == 1
+    assert tokens.stats.misses == 2
+
+
+def make_request(
+    path: str, query: str, headers: tuple[tuple[bytes, bytes], ...] = ()
+) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": query.encode(),
+            "headers": list(headers),
+        }
+    )
+
+
+def test_gzipped_entries_always_vary_on_accept_encoding():
+    entry = CacheEntry.create(b'{"id":1}', expire=60, compress=True)
+    gzip_request = make_request("/", "", ((b"accept-encoding", b"gzip"),))
+    identity_request = make_request("/", "")
+    etag_request = make_request(
+        "/", "", ((b"if-none-match", f'W/"{entry.etag}"'.encode()),)
+    )
+
+    gzipped = entry.to_response(gzip_request, {})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzipped.headers["Vary"] == "Accept-Encoding"
+
+    identity = entry.to_response(identity_request, {})
+    assert identity.body == b'{"id":1}'
+    assert "Content-Encoding" not in identity.headers
+    assert identity.headers["Vary"] == "Accept-Encoding"
+
+    not_modified = entry.to_response(etag_request, {})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["Vary"] == "Accept-Encoding"
+
+    plain = CacheEntry.create(b'{"id":1}', expire=60, compress=False)
+    assert "Vary" not in plain.to_response(identity_request, {}).headers
+
+
+def test_request_key_builder_normalizes_and_hashes():
+    key = request_key_builder(
+        None, "fastapi-cache:osu_api", request=make_request("/search_map", "q=a&m=0")
+    )
+    assert key == request_key_builder(
+        None, "fastapi-cache:osu_api", request=make_request("/search_map/", "m=0&q=a")
+    )
+    assert key.startswith("fastapi-cache:osu_api:")
+
+    long_key = request_key_builder(
+        None,
+        "fastapi-cache:osu_api",
+        request=make_request("/search_map", "q=" + "a" * 1000),
+    )
+    assert len(long_key) == len(key)
+
+
+async def test_tagged_entries_are_dropped_again_after_invalidation(monkeypatch):
+    redis = FakeAsyncRedis()
+    backend = TwoTierBackend(redis, LocalLRUCache(max_bytes=1024, ttl=30))
+    monkeypatch.setattr(settings, "CACHE_TAG_REINVALIDATE_DELAY", 0.1)
+    FastAPICache.reset()
+    FastAPICache.init(backend)
+    try:
+        await set_tagged(backend, "user:1", b"old", 60, ["user:1"])
+        assert await redis.smembers(CACHE_TAG_KEY.format("user:1")) == {b"user:1"}
+
+        await invalidate_tags("user:1")
+        assert await backend.get("user:1") is None
+
+        # A request that read the data before the write caches it afterwards
+        await set_tagged(backend, "user:1", b"old", 60, ["user:1"])
+        await asyncio.sleep(0.2)
+        assert await redis.get("user:1") is None
+        assert await backend.get("user:1") is None
+    finally:
+        FastAPICache.reset()
+        await redis.close()
+
+
+async def test_expired_entry_is_served_while_upstream_fails():
+    redis = FakeAsyncRedis()
+    backend = TwoTierBackend(redis, LocalLRUCache(max_bytes=1024, ttl=30))
+    FastAPICache.reset()
+    FastAPICache.init(backend)
+    upstream_errors = []
+
+    app = FastAPI()
+
+    # Entries are stale right away
+    @app.get("/beatmap")
+    @cache(expire=0, namespace="stale_test")
+    async def get_beatmap() -> dict:
+        if upstream_errors:
+            raise upstream_errors[0]
+        return {"id": 1}
+
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app), base_url="https://test"
+        ) as client:
+            response = await client.get("/beatmap")
+            assert response.json() == {"id": 1}
+            assert "X-Cache-Stale" not in response.headers
+
+            for error in (
+                CircuitOpenError("osu_api", 30),
+                HTTPException(503, "osu! API is down"),
+            ):
+                upstream_errors[:] = [error]
+                response = await client.get("/beatmap")
+                assert response.status_code == 200
+                assert response.json() == {"id": 1}
+                assert response.headers["X-Cache-Stale"] == "true"
+
+            # Client errors are not hidden behind old responses
+            upstream_errors[:] = [HTTPException(404, "Beatmap not found")]
+            response = await client.get("/beatmap")
+            assert response.status_code == 404
+    finally:
+        FastAPICache.reset()
+        await redis.close()
@@ -0,0 +1,43 @@
+import pytest
+from fastapi import HTTPException
+
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+
+
+async def fail(breaker: CircuitBreaker, status_code: int = 502):
+    with pytest.raises(HTTPException):
+        async with breaker:
+            raise HTTPException(status_code=status_code)
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_time=60)
+    for _ in range(3):
+        await fail(breaker)
+    assert breaker.state == CircuitState.OPEN
+
+    with pytest.raises(CircuitOpenError) as ex:
+        async with breaker:
+            pass
+    assert ex.value.status_code == 503
+    assert "Retry-After" in ex.value.headers
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_open_circuit():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_time=60)
+    await fail(breaker, 404)
+    await fail(breaker, 404)
+    assert breaker.state == CircuitState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_closes_circuit():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=0)
+    await fail(breaker)
+    assert breaker.state == CircuitState.OPEN
+
+    async with breaker:
+        assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.state == CircuitState.CLOSED
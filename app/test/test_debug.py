@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.utils.sentry import before_send_transaction
+
+
+@pytest.mark.asyncio
+async def test_debug_endpoints_need_admin(test_client, headers):
+    response = await test_client.get("debug/profiling", headers=headers)
+    assert response.status_code == 403
+
+
+def test_before_send_transaction_keeps_slow_and_failed(monkeypatch):
+    monkeypatch.setattr("app.utils.sentry.settings.SENTRY_TRACES_SAMPLE_RATE", 0)
+    monkeypatch.setattr("app.utils.sentry.settings.SENTRY_SLOW_REQUEST_SECONDS", 1)
+    start = datetime.now(timezone.utc)
+
+    def transaction(seconds: float, status: str = "ok"):
+        return {
+            "start_timestamp": start,
+            "timestamp": start + timedelta(seconds=seconds),
+            "contexts": {"trace": {"status": status}},
+        }
+
+    assert before_send_transaction(transaction(0.1), {}) is None
+    assert before_send_transaction(transaction(0.1, "not_found"), {}) is None
+    assert before_send_transaction(transaction(2), {}) is not None
+    assert before_send_transaction(transaction(0.1, "internal_error"), {}) is not None
@@ -1,6 +1,10 @@
 import pytest
+from pymongo.read_preferences import Primary
 
+from app.config import settings
+from app.db.instance import AsyncMongoClient, get_mongo_db, mongo_read_preference
 from app.test.helpers import add_fake_user_to_db
+from app.utils.cache_warmer import CacheWarmer
 
 
 @pytest.mark.asyncio
@@ -15,3 +19,54 @@ async def test_leaderboard(test_client, mongo_db, headers, test_user_id):
     assert response.status_code == 200
     response = response.json()
     assert len(response) >= 1
+
+
+@pytest.mark.asyncio
+async def test_cache_warm_up(test_client, lifespan_manager):
+    cache_warmer = await CacheWarmer.get_instance()
+    cache_warmer.start(lifespan_manager, None)
+    await cache_warmer.warmup_task
+    await CacheWarmer.close_instance()
+
+    response = await test_client.get("leaderboard")
+    assert response.status_code == 200
+    assert response.headers["X-FastAPI-Cache"] == "HIT"
+
+
+@pytest.mark.asyncio
+async def test_cache_warm_up_logs_failures(lifespan_manager, monkeypatch, caplog):
+    async def fail(leaderboards):
+        raise RuntimeError("boom")
+
+    cache_warmer = await CacheWarmer.get_instance()
+    monkeypatch.setattr(cache_warmer, "profile_user_ids", fail)
+    cache_warmer.start(lifespan_manager, None)
+    await cache_warmer.warmup_task
+    await CacheWarmer.close_instance()
+
+    assert "Could not warm up the cache" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_reads_from_replicas(mongo_db):
+    read_preference = mongo_db.influences_read_collection.read_preference
+    assert read_preference == mongo_read_preference()
+    assert mongo_db.influences_collection.read_preference == Primary()
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_cache_key_is_shared_between_clients(
+    test_client, lifespan_manager
+):
+    response = await test_client.get("leaderboard?country=TR")
+    assert response.status_code == 200
+
+    # Another worker has its own mongo client
+    other_client = AsyncMongoClient(settings.MONGO_URL)
+    lifespan_manager.dependency_overrides[get_mongo_db] = lambda: other_client
+    try:
+        response = await test_client.get("leaderboard?country=TR")
+    finally:
+        lifespan_manager.dependency_overrides.pop(get_mongo_db)
+        other_client.close()
+    assert response.headers["X-FastAPI-Cache"] == "HIT"
@@ -1,5 +1,17 @@
+import asyncio
+import time
+
+from fastapi import HTTPException
 import pytest
 
+from app.utils import osu_requester
+from app.utils.circuit_breaker import CircuitOpenError, CircuitState
+from app.utils.osu_requester import (
+    OsuTokenManager,
+    Requester,
+    get_osu_credentials_grant_token,
+)
+
 
 @pytest.mark.asyncio
 async def test_osu_api_user(test_client, headers, test_user_id):
@@ -27,3 +39,61 @@ async def test_osu_api_search(test_client, headers):
 async def test_osu_api_search_map(test_client, headers):
     response = await test_client.get("osu_api/search_map?q=hi", headers=headers)
     assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_osu_api_cached_response(test_client, headers):
+    first = await test_client.get("osu_api/beatmap/41823", headers=headers)
+    assert first.status_code == 200
+    second = await test_client.get("osu_api/beatmap/41823", headers=headers)
+    assert second.status_code == 200
+    assert second.headers["X-FastAPI-Cache"] == "HIT"
+    assert second.headers["content-type"] == "application/json"
+    assert second.json() == first.json()
+
+    response = await test_client.get("cache/stats")
+    assert response.status_code == 200
+    stats = {item["endpoint"]: item for item in response.json()}
+    assert stats["app.routers.osu_api.get_beatmapset"]["hits"] >= 1
+
+    response = await test_client.get("metrics")
+    assert response.status_code == 200
+    assert 'cache_requests_total{namespace="osu_api",result="hit"}' in response.text
+    assert 'route="/osu_api/beatmap/{id}"' in response.text
+
+
+@pytest.mark.asyncio
+async def test_osu_api_without_session(test_client, test_user_id):
+    response = await test_client.get(f"osu_api/user/{test_user_id}")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_osu_token_is_kept_until_it_expires(monkeypatch):
+    async def fail():
+        raise HTTPException(status_code=502)
+
+    monkeypatch.setattr(osu_requester, "get_osu_credentials_grant_token", fail)
+    token_manager = OsuTokenManager()
+    token_manager.refresh_lock = asyncio.Lock()
+    token_manager.access_token = "current"
+    # Due for a refresh, but still valid
+    token_manager.expires_at = time.monotonic() + 60
+    assert await token_manager.get_token() == "current"
+
+    token_manager.expires_at = time.monotonic() - 1
+    with pytest.raises(HTTPException):
+        await token_manager.get_token()
+
+
+@pytest.mark.asyncio
+async def test_osu_token_request_uses_circuit_breaker(lifespan_manager):
+    requester = await Requester.get_instance()
+    circuit_breaker = requester.circuit_breaker
+    circuit_breaker.state = CircuitState.OPEN
+    circuit_breaker.opened_at = time.monotonic()
+    try:
+        with pytest.raises(CircuitOpenError):
+            await get_osu_credentials_grant_token()
+    finally:
+        circuit_breaker.record_success()
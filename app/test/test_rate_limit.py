@@ -0,0 +1,52 @@
+import asyncio
+import math
+
+from fakeredis import FakeAsyncRedis
+import pytest
+
+from app.config import settings
+from app.utils import rate_limit as rate_limit_module
+from app.utils.rate_limit import RateLimit, take_token
+
+# 10 tokens a second, a token is back after 100ms
+FAST_LIMIT = RateLimit("test", burst=3, per_minute=600)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_runs_out_and_refills():
+    redis = FakeAsyncRedis()
+    try:
+        for _ in range(FAST_LIMIT.burst):
+            assert await take_token(redis, FAST_LIMIT, 1) == 0
+        assert await take_token(redis, FAST_LIMIT, 1) == 1
+        # Other users have their own bucket
+        assert await take_token(redis, FAST_LIMIT, 2) == 0
+
+        await asyncio.sleep(0.15)
+        assert await take_token(redis, FAST_LIMIT, 1) == 0
+        assert await take_token(redis, FAST_LIMIT, 1) == 1
+    finally:
+        await redis.close()
+
+
+@pytest.mark.asyncio
+async def test_profile_writes_are_limited(test_client, headers, monkeypatch):
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(rate_limit_module, "get_redis", lambda: redis)
+    try:
+        for _ in range(settings.RATE_LIMIT_PROFILE_BURST):
+            response = await test_client.post(
+                "users/bio", json={"bio": "test"}, headers=headers
+            )
+            assert response.status_code == 200
+
+        response = await test_client.post(
+            "users/bio", json={"bio": "test"}, headers=headers
+        )
+        assert response.status_code == 429
+        # One token is missing, the time it takes to refill it
+        assert response.headers["Retry-After"] == str(
+            math.ceil(60 / settings.RATE_LIMIT_PROFILE_PER_MINUTE)
+        )
+    finally:
+        await redis.close()
@@ -0,0 +1,84 @@
+import json
+
+from fakeredis import FakeAsyncRedis
+import pytest
+
+from app.config import settings
+from app.routers import auth
+from app.test.helpers import add_fake_user_to_db
+from app.utils import jwt
+from app.utils.session import (
+    SESSION_KEY,
+    create_session,
+    delete_session,
+    get_session,
+    is_session_id,
+)
+
+
+@pytest.mark.asyncio
+async def test_session_lifecycle():
+    redis = FakeAsyncRedis()
+    user = {"id": 1, "username": "test", "country": "TR"}
+    try:
+        session_id = await create_session(redis, user)
+        assert is_session_id(session_id)
+        assert (
+            0 < await redis.ttl(SESSION_KEY.format(session_id)) <= settings.SESSION_TTL
+        )
+
+        session = await get_session(redis, session_id)
+        assert session.claims() == user
+
+        await delete_session(redis, session_id)
+        assert await get_session(redis, session_id) is None
+    finally:
+        await redis.close()
+
+
+@pytest.mark.asyncio
+async def test_sessions_with_osu_tokens_still_load():
+    redis = FakeAsyncRedis()
+    user = {"id": 1, "username": "test", "country": "TR"}
+    try:
+        # Sessions used to keep the user's osu! token
+        await redis.set(
+            SESSION_KEY.format("s:old"),
+            json.dumps(
+                {
+                    "user": user,
+                    "access_token": "token",
+                    "refresh_token": "refresh",
+                    "expires_at": 0,
+                }
+            ),
+        )
+        session = await get_session(redis, "s:old")
+        assert session.claims() == user
+    finally:
+        await redis.close()
+
+
+@pytest.mark.asyncio
+async def test_logout_deletes_session(test_client, mongo_db, test_user_id, monkeypatch):
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(auth, "get_redis", lambda: redis)
+    monkeypatch.setattr(jwt, "get_redis", lambda: redis)
+    await add_fake_user_to_db(mongo_db, test_user_id)
+    session_id = await create_session(
+        redis, {"id": test_user_id, "username": "test", "country": "TR"}
+    )
+    headers = {"Cookie": f"user_token={session_id}"}
+    try:
+        response = await test_client.get("users/me", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["id"] == test_user_id
+
+        response = await test_client.get("oauth/logout", headers=headers)
+        assert response.status_code == 200
+        assert not await redis.exists(SESSION_KEY.format(session_id))
+
+        response = await test_client.get("users/me", headers=headers)
+        assert response.status_code == 401
+    finally:
+        await redis.close()
@@ -1,5 +1,7 @@
 import pytest
 
+from app.config import settings
+from app.routers.osu_api import UserOsu
 from app.test.helpers import add_fake_user_to_db
 
 
@@ -18,6 +20,21 @@ async def test_set_user_bio(test_client, headers):
     assert response.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_set_user_bio_refreshes_cached_user(
+    test_client, headers, mongo_db, test_user_id
+):
+    await add_fake_user_to_db(mongo_db, test_user_id)
+    await test_client.get(f"users/{test_user_id}", headers=headers)
+    response = await test_client.post(
+        "users/bio", json={"bio": "cached bio"}, headers=headers
+    )
+    assert response.status_code == 200
+
+    response = await test_client.get(f"users/{test_user_id}", headers=headers)
+    assert response.json()["bio"] == "cached bio"
+
+
 @pytest.mark.asyncio
 async def test_add_and_remove_beatmap(test_client, headers):
     response = await test_client.post(
@@ -57,3 +74,66 @@ async def test_influence_order(test_client, headers, mongo_db, test_user_id):
     response = response.json()
     assert response[0]["influenced_to"] == influenced_to_id_list[0]
     assert response[1]["influenced_to"] == influenced_to_id_list[1]
+
+
+@pytest.mark.asyncio
+async def test_mongo_commands_are_counted_per_route(
+    test_client, headers, mongo_db, test_user_id
+):
+    await add_fake_user_to_db(mongo_db, test_user_id)
+    response = await test_client.get("users/me", headers=headers)
+    assert response.status_code == 200
+
+    response = await test_client.get("metrics")
+    assert 'mongo_request_commands_count{route="/users/me"}' in response.text
+    assert any(
+        line.startswith("mongo_command_seconds_count")
+        and 'collection="Users"' in line
+        and 'route="/users/me"' in line
+        for line in response.text.splitlines()
+    )
+
+
+@pytest.mark.asyncio
+async def test_profile_writes_are_not_limited_without_redis(test_client, headers):
+    for _ in range(settings.RATE_LIMIT_PROFILE_BURST + 1):
+        response = await test_client.post(
+            "users/bio", json={"bio": "test"}, headers=headers
+        )
+        assert response.status_code == 200
+
+
+def make_osu_user(user_id: int, username: str) -> UserOsu:
+    return UserOsu.model_validate(
+        {
+            "id": user_id,
+            "username": username,
+            "avatar_url": "test",
+            "country": {"code": "TR", "name": "Türkiye"},
+            "groups": [],
+            "previous_usernames": [],
+            "ranked_and_approved_beatmapset_count": 0,
+            "ranked_beatmapset_count": 1,
+            "nominated_beatmapset_count": 0,
+            "guest_beatmapset_count": 0,
+            "loved_beatmapset_count": 0,
+            "graveyard_beatmapset_count": 0,
+            "pending_beatmapset_count": 0,
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_login_only_invalidates_changed_users(test_client, mongo_db):
+    await mongo_db.create_user(make_osu_user(9_000_001, "login"))
+    response = await test_client.get("leaderboard?country=TR")
+    assert response.status_code == 200
+
+    # Logging in again without changes keeps the cached leaderboard
+    await mongo_db.create_user(make_osu_user(9_000_001, "login"))
+    response = await test_client.get("leaderboard?country=TR")
+    assert response.headers["X-FastAPI-Cache"] == "HIT"
+
+    await mongo_db.create_user(make_osu_user(9_000_001, "renamed"))
+    response = await test_client.get("leaderboard?country=TR")
+    assert response.headers["X-FastAPI-Cache"] == "MISS"
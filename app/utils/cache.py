@@ -0,0 +1,560 @@
+import asyncio
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+import math
+import struct
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.dependencies.utils import (
+    get_typed_return_annotation,
+    get_typed_signature,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.types import Backend, KeyBuilder
+from pydantic import TypeAdapter
+from redis import asyncio as aioredis
+
+from app.config import settings
+from app.utils.metrics import CACHE_BACKEND_SECONDS, CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+CACHE_INVALIDATION_CHANNEL = "fastapi-cache:invalidate"
+CACHE_TAG_KEY = "fastapi-cache:tag:{}"
+LEADERBOARD_ALL_COUNTRIES = "all"
+
+
+def user_tag(user_id: int) -> str:
+    """Anything built from the user's document, influences or mentions."""
+    return f"user:{user_id}"
+
+
+def leaderboard_tag(country: Optional[str]) -> str:
+    return f"leaderboard:{country or LEADERBOARD_ALL_COUNTRIES}"
+
+
+class LocalLRUCache:
+    """
+    Byte bounded LRU that lives in the worker process.
+    Entries expire after `ttl` seconds at most, so other workers' writes are picked up
+    even if an invalidation message gets lost.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        # key -> (local expiry, remote expiry, value)
+        self.entries: OrderedDict[str, tuple[float, Optional[float], bytes]] = (
+            OrderedDict()
+        )
+
+    def get(self, key: str) -> tuple[int, Optional[bytes]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return 0, None
+
+        now = time.monotonic()
+        local_expires_at, remote_expires_at, value = entry
+        if local_expires_at <= now:
+            self.pop(key)
+            return 0, None
+
+        self.entries.move_to_end(key)
+        if remote_expires_at is None:
+            return -1, value
+        return max(math.ceil(remote_expires_at - now), 0), value
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None):
+        self.pop(key)
+        if len(value) > self.max_bytes:
+            return
+
+        now = time.monotonic()
+        if ttl is not None and ttl > 0:
+            local_expires_at = now + min(self.ttl, ttl)
+            remote_expires_at = now + ttl
+        else:
+            local_expires_at = now + self.ttl
+            remote_expires_at = None
+
+        self.entries[key] = (local_expires_at, remote_expires_at, value)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def pop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[2])
+
+    def clear(self, prefix: Optional[str] = None) -> int:
+        if prefix is None:
+            count = len(self.entries)
+            self.entries.clear()
+            self.size = 0
+            return count
+
+        keys = [key for key in self.entries if key.startswith(prefix)]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+
+class TwoTierBackend(Backend):
+    """
+    fastapi-cache backend that serves hot keys from a LocalLRUCache and falls back to redis.
+    Writes and clears are announced on a redis channel so every worker drops its local copy.
+    """
+
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        local: LocalLRUCache,
+        channel: str = CACHE_INVALIDATION_CHANNEL,
+    ):
+        self.redis = redis
+        self.remote = RedisBackend(redis)
+        self.local = local
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex
+        self.listener_task: Optional[asyncio.Task] = None
+
+    async def get_with_ttl(self, key: str) -> tuple[int, Optional[bytes]]:
+        ttl, value = self.local.get(key)
+        if value is not None:
+            return ttl, value
+
+        ttl, value = await self.remote.get_with_ttl(key)
+        if value is not None:
+            self.local.set(key, value, ttl)
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        _, value = await self.get_with_ttl(key)
+        return value
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None):
+        await self.remote.set(key, value, expire)
+        self.local.set(key, value, expire)
+        await self.publish_invalidation(key=key)
+
+    async def clear(
+        self, namespace: Optional[str] = None, key: Optional[str] = None
+    ) -> int:
+        count = await self.remote.clear(namespace, key)
+        self.invalidate_local(namespace=namespace, key=key)
+        await self.publish_invalidation(namespace=namespace, key=key)
+        return count
+
+    async def set_tagged(
+        self, key: str, value: bytes, expire: int, tags: Iterable[str]
+    ):
+        """
+        Like set, and remembers that `key` depends on `tags` in the same transaction,
+        so an invalidation never sees the value without its tags.
+        The tag sets live as long as their longest entry.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, value, ex=expire)
+            for tag in tags:
+                tag_key = CACHE_TAG_KEY.format(tag)
+                pipe.sadd(tag_key, key)
+                pipe.expire(tag_key, expire, nx=True)
+                pipe.expire(tag_key, expire, gt=True)
+            await pipe.execute()
+        self.local.set(key, value, expire)
+        await self.publish_invalidation(key=key)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        tag_keys = [CACHE_TAG_KEY.format(tag) for tag in tags]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.sunion(tag_keys)
+            pipe.delete(*tag_keys)
+            keys, _ = await pipe.execute()
+
+        keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+        if not keys:
+            return 0
+        count = await self.redis.delete(*keys)
+        for key in keys:
+            self.local.pop(key)
+        await self.publish_invalidation(keys=keys)
+        return count
+
+    def invalidate_local(
+        self,
+        namespace: Optional[str] = None,
+        key: Optional[str] = None,
+        keys: Optional[list[str]] = None,
+    ):
+        if namespace:
+            self.local.clear(prefix=f"{namespace}:")
+        elif key:
+            self.local.pop(key)
+        for key in keys or ():
+            self.local.pop(key)
+
+    async def publish_invalidation(
+        self,
+        namespace: Optional[str] = None,
+        key: Optional[str] = None,
+        keys: Optional[list[str]] = None,
+    ):
+        message = json.dumps(
+            {
+                "origin": self.instance_id,
+                "namespace": namespace,
+                "key": key,
+                "keys": keys,
+            }
+        )
+        try:
+            await self.redis.publish(self.channel, message)
+        except Exception:
+            logger.warning("Could not publish cache invalidation", exc_info=True)
+
+    async def start(self):
+        self.listener_task = asyncio.create_task(self.listen())
+
+    async def close(self):
+        if self.listener_task is not None:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+            self.listener_task = None
+
+    async def listen(self):
+        """Drops local entries that other workers wrote or cleared. Reconnects forever."""
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Invalidations might have been missed while we were not subscribed
+                self.local.clear()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    self.handle_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning(
+                    "Cache invalidation listener disconnected, retrying",
+                    exc_info=True,
+                )
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.reset()
+
+    def handle_invalidation(self, data: bytes | str):
+        message = json.loads(data)
+        if message["origin"] == self.instance_id:
+            return
+        self.invalidate_local(
+            namespace=message["namespace"],
+            key=message["key"],
+            keys=message.get("keys"),
+        )
+
+
+# tag -> keys, for backends that can't keep tags themselves (e.g. the in memory one in tests)
+local_tag_keys: dict[str, set[str]] = {}
+
+
+async def set_tagged(
+    backend: Backend, key: str, value: bytes, expire: int, tags: Iterable[str]
+):
+    if isinstance(backend, TwoTierBackend):
+        await backend.set_tagged(key, value, expire, tags)
+        return
+    await backend.set(key, value, expire)
+    for tag in tags:
+        local_tag_keys.setdefault(tag, set()).add(key)
+
+
+async def drop_tagged_keys(*tags: str):
+    try:
+        backend = FastAPICache.get_backend()
+    except AssertionError:
+        # Cache is not initialized, nothing to invalidate
+        return
+
+    try:
+        if isinstance(backend, TwoTierBackend):
+            await backend.invalidate_tags(tags)
+            return
+        for tag in tags:
+            for key in local_tag_keys.pop(tag, ()):
+                try:
+                    await backend.clear(key=key)
+                except KeyError:
+                    # Already expired
+                    pass
+    except Exception:
+        logger.warning(f"Could not invalidate cache tags {tags}", exc_info=True)
+
+
+async def invalidate_tags(*tags: str):
+    """
+    Drops every cached response that depends on one of the tags, on every worker.
+    A request that read the old data before the write can still cache it afterwards,
+    so the tags are dropped once more after such requests are done.
+    """
+    await drop_tagged_keys(*tags)
+    invalidate_tags_later(settings.CACHE_TAG_REINVALIDATE_DELAY, *tags)
+
+
+# Tasks are only weakly referenced by the loop
+delayed_invalidations: set[asyncio.Task] = set()
+
+
+def invalidate_tags_later(delay: float, *tags: str):
+    async def invalidate():
+        await asyncio.sleep(delay)
+        await drop_tagged_keys(*tags)
+
+    task = asyncio.create_task(invalidate())
+    delayed_invalidations.add(task)
+    task.add_done_callback(delayed_invalidations.discard)
+
+
+# flags, fresh until (unix time), etag
+CACHE_ENTRY_HEADER = struct.Struct("!Bd8s")
+CACHE_ENTRY_GZIP = 1
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    gzipped: bool
+    fresh_until: float
+    etag: str
+
+    @classmethod
+    def create(cls, body: bytes, expire: int, compress: bool):
+        digest = hashlib.blake2b(body, digest_size=8).digest()
+        if compress:
+            body = gzip.compress(body, compresslevel=5)
+        return cls(body, compress, time.time() + expire, digest.hex())
+
+    @classmethod
+    def decode(cls, data: bytes):
+        flags, fresh_until, digest = CACHE_ENTRY_HEADER.unpack_from(data)
+        body = data[CACHE_ENTRY_HEADER.size :]
+        return cls(body, bool(flags & CACHE_ENTRY_GZIP), fresh_until, digest.hex())
+
+    def encode(self) -> bytes:
+        flags = CACHE_ENTRY_GZIP if self.gzipped else 0
+        header = CACHE_ENTRY_HEADER.pack(
+            flags, self.fresh_until, bytes.fromhex(self.etag)
+        )
+        return header + self.body
+
+    def to_response(self, request: Request, headers: dict[str, str]) -> Response:
+        headers["ETag"] = f'W/"{self.etag}"'
+        if self.gzipped:
+            # The body depends on Accept-Encoding, shared caches must not mix them up
+            headers["Vary"] = "Accept-Encoding"
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+
+        body = self.body
+        if self.gzipped:
+            if "gzip" in request.headers.get("accept-encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+            else:
+                body = gzip.decompress(body)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+@dataclass
+class CacheEndpointStats:
+    hits: int = 0
+    misses: int = 0
+    stale_hits: int = 0
+    # Time spent validating and serializing responses on misses
+    encode_seconds: float = 0.0
+
+    @property
+    def saved_cpu_seconds(self) -> float:
+        """Hits skip validation and serialization, so each one saves an average encode."""
+        if self.misses == 0:
+            return 0.0
+        return self.hits * self.encode_seconds / self.misses
+
+
+cache_stats: dict[str, CacheEndpointStats] = {}
+
+
+def _response_encoder(func):
+    return_type = get_typed_return_annotation(func)
+    if return_type is None or return_type is Any:
+        return lambda result: json.dumps(
+            jsonable_encoder(result), separators=(",", ":")
+        ).encode()
+
+    adapter = TypeAdapter(return_type)
+    return lambda result: adapter.dump_json(
+        adapter.validate_python(result), by_alias=True
+    )
+
+
+def cache(
+    expire: int,
+    namespace: str = "",
+    key_builder: Optional[KeyBuilder] = None,
+    tags: Optional[Callable[[dict], Iterable[str]]] = None,
+):
+    """
+    Caches the final encoded response body of an endpoint.
+    Hits are returned verbatim, skipping response model validation and serialization.
+    The return annotation of the endpoint is used as the response model on misses.
+    `tags` gets the endpoint's arguments and returns the tags of the entry, `invalidate_tags` drops it.
+    """
+
+    def wrapper(func):
+        signature = get_typed_signature(func)
+        request_param = next(
+            (p for p in signature.parameters.values() if p.annotation is Request),
+            None,
+        )
+        if request_param is None:
+            request_param = inspect.Parameter(
+                "__cache_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request
+            )
+            parameters = [*signature.parameters.values(), request_param]
+            wrapped_signature = signature.replace(parameters=parameters)
+            inject_request = True
+        else:
+            wrapped_signature = signature
+            inject_request = False
+
+        encode_response = _response_encoder(func)
+        stats = cache_stats.setdefault(
+            f"{func.__module__}.{func.__name__}", CacheEndpointStats()
+        )
+
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            request: Request = kwargs[request_param.name]
+            func_kwargs = kwargs.copy()
+            if inject_request:
+                func_kwargs.pop(request_param.name)
+
+            cache_control = request.headers.get("Cache-Control")
+            if not FastAPICache.get_enable() or cache_control == "no-store":
+                CACHE_REQUESTS.labels(namespace, "bypass").inc()
+                return await func(*args, **func_kwargs)
+
+            backend = FastAPICache.get_backend()
+            builder = key_builder or FastAPICache.get_key_builder()
+            cache_key = builder(
+                func,
+                f"{FastAPICache.get_prefix()}:{namespace}",
+                request=request,
+                response=None,
+                args=args,
+                kwargs=func_kwargs,
+            )
+            if inspect.isawaitable(cache_key):
+                cache_key = await cache_key
+
+            cached = None
+            if cache_control != "no-cache":
+                try:
+                    with CACHE_BACKEND_SECONDS.labels(namespace, "get").time():
+                        cached = await backend.get(cache_key)
+                except Exception:
+                    logger.warning(
+                        f"Error retrieving cache key '{cache_key}' from backend",
+                        exc_info=True,
+                    )
+
+            entry = None
+            if cached is not None:
+                try:
+                    entry = CacheEntry.decode(cached)
+                except struct.error:
+                    logger.warning(f"Discarding malformed cache entry '{cache_key}'")
+
+            status_header = FastAPICache.get_cache_status_header()
+            if entry is not None and entry.fresh_until > time.time():
+                stats.hits += 1
+                CACHE_REQUESTS.labels(namespace, "hit").inc()
+                max_age = math.ceil(entry.fresh_until - time.time())
+                headers = {"Cache-Control": f"max-age={max_age}", status_header: "HIT"}
+                return entry.to_response(request, headers)
+
+            try:
+                result = await func(*args, **func_kwargs)
+            except HTTPException as ex:
+                # Upstream is failing, an expired response is better than an error
+                if entry is None or ex.status_code < 500:
+                    raise
+                logger.warning(f"Serving stale cache entry '{cache_key}': {ex.detail}")
+                stats.stale_hits += 1
+                CACHE_REQUESTS.labels(namespace, "stale").inc()
+                headers = {
+                    "Cache-Control": "max-age=0",
+                    status_header: "STALE",
+                    "X-Cache-Stale": "true",
+                }
+                return entry.to_response(request, headers)
+
+            if isinstance(result, Response):
+                return result
+
+            start = time.perf_counter()
+            body = encode_response(result)
+            compress = (
+                settings.CACHE_GZIP_RESPONSES
+                and len(body) >= settings.CACHE_GZIP_MIN_BYTES
+            )
+            entry = CacheEntry.create(body, expire, compress)
+            stats.misses += 1
+            CACHE_REQUESTS.labels(namespace, "miss").inc()
+            stats.encode_seconds += time.perf_counter() - start
+
+            try:
+                with CACHE_BACKEND_SECONDS.labels(namespace, "set").time():
+                    if tags is None:
+                        await backend.set(
+                            cache_key,
+                            entry.encode(),
+                            expire + settings.CACHE_STALE_TTL,
+                        )
+                    else:
+                        await set_tagged(
+                            backend,
+                            cache_key,
+                            entry.encode(),
+                            expire + settings.CACHE_STALE_TTL,
+                            tags(func_kwargs),
+                        )
+            except Exception:
+                logger.warning(
+                    f"Error setting cache key '{cache_key}' in backend", exc_info=True
+                )
+
+            headers = {"Cache-Control": f"max-age={expire}", status_header: "MISS"}
+            return entry.to_response(request, headers)
+
+        inner.__signature__ = wrapped_signature
+        return inner
+
+    return wrapper
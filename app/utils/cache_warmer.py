@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Optional
+from urllib.parse import urlencode
+
+import httpx
+from fastapi import FastAPI, Request
+from redis import asyncio as aioredis
+
+from app.config import settings
+from app.db.instance import get_redis
+from app.utils.jwt import obtain_jwt
+
+logger = logging.getLogger(__name__)
+
+# Requests of the warmer carry this header, so they are not counted as visits
+CACHE_WARMUP_HEADER = "X-Cache-Warmup"
+CACHE_WARMUP_LOCK_KEY = "cache-warmup:lock"
+# kind, day
+CACHE_WARMUP_ACCESS_KEY = "cache-warmup:access:{}:{}"
+LEADERBOARD_ACCESS = "leaderboard"
+PROFILE_ACCESS = "profile"
+# Visits of today and yesterday decide what is warmed, so the stats follow what is popular now
+ACCESS_STATS_DAYS = 2
+ACCESS_STATS_FLUSH_INTERVAL = 60
+# Only one worker warms up after a deploy
+WARMUP_LOCK_TTL = 5 * 60
+WARMUP_REQUEST_TIMEOUT = 60
+
+# kind -> member -> visits since the last flush
+access_counts: dict[str, Counter] = {
+    LEADERBOARD_ACCESS: Counter(),
+    PROFILE_ACCESS: Counter(),
+}
+
+
+def access_stats_keys(kind: str, now: Optional[float] = None) -> list[str]:
+    """Keys of the daily sorted sets of `kind`, today's first."""
+    now = time.time() if now is None else now
+    return [
+        CACHE_WARMUP_ACCESS_KEY.format(
+            kind, time.strftime("%Y%m%d", time.gmtime(now - day * 24 * 60 * 60))
+        )
+        for day in range(ACCESS_STATS_DAYS)
+    ]
+
+
+def record_access(request: Request, kind: str, member: str):
+    # Without redis the counts are never flushed, nothing would read them anyway
+    if CACHE_WARMUP_HEADER in request.headers or get_redis() is None:
+        return
+    access_counts[kind][member] += 1
+
+
+async def record_leaderboard_access(request: Request):
+    """Dependency counting visits of leaderboard variants, in process until the next flush."""
+    query = urlencode(sorted(request.query_params.multi_items()))
+    record_access(request, LEADERBOARD_ACCESS, query)
+
+
+async def record_profile_access(request: Request, user_id: int):
+    """Dependency counting profile visits, in process until the next flush."""
+    record_access(request, PROFILE_ACCESS, str(user_id))
+
+
+def profile_paths(user_id: int) -> list[str]:
+    """Cached requests a profile page makes."""
+    return [
+        f"/users/{user_id}",
+        f"/influence/{user_id}",
+        f"/influence/{user_id}/mentions",
+    ]
+
+
+class CacheWarmer:
+    """
+    Requests the most used leaderboard variants and profiles through the app itself after startup,
+    so their responses are cached before visitors ask for them. Runs in the background, startup
+    doesn't wait for it.
+
+    Leaderboard variants come from CACHE_WARMUP_LEADERBOARDS and the most visited ones,
+    profiles from CACHE_WARMUP_USER_IDS, the most visited ones and the warmed leaderboards.
+    Visits are counted in process and added to daily redis sorted sets every minute.
+    """
+
+    _instance = None
+    _lock = asyncio.Lock()
+
+    @classmethod
+    async def get_instance(cls):
+        """To be able to use asyncio lock"""
+        if cls._instance is None:
+            async with cls._lock:
+                if cls._instance is None:  # Double-check locking
+                    cls._instance = CacheWarmer()
+                    cls._instance.app = None
+                    cls._instance.redis = None
+                    cls._instance.warmup_task = None
+                    cls._instance.flush_task = None
+        return cls._instance
+
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance is not None:
+            await cls._instance.close()
+            cls._instance = None
+
+    def start(self, app: FastAPI, redis: Optional[aioredis.Redis]):
+        self.app = app
+        self.redis = redis
+        if settings.CACHE_WARMUP_ENABLED:
+            self.warmup_task = asyncio.create_task(self.warm_up())
+        if redis is not None:
+            self.flush_task = asyncio.create_task(self.keep_flushing())
+
+    async def close(self):
+        for task in (self.warmup_task, self.flush_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self.redis is not None:
+            await self.flush()
+
+    async def keep_flushing(self):
+        while True:
+            await asyncio.sleep(ACCESS_STATS_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        key_ttl = ACCESS_STATS_DAYS * 24 * 60 * 60
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for kind, counts in access_counts.items():
+                    if not counts:
+                        continue
+                    key = access_stats_keys(kind)[0]
+                    for member, count in counts.items():
+                        pipe.zincrby(key, count, member)
+                    pipe.expire(key, key_ttl)
+                    counts.clear()
+                await pipe.execute()
+        except Exception:
+            logger.warning("Could not save cache warm up access stats", exc_info=True)
+
+    async def most_accessed(self, kind: str, count: int) -> list[str]:
+        if self.redis is None or count <= 0:
+            return []
+        totals = Counter()
+        try:
+            for key in access_stats_keys(kind):
+                # Twice as many per day, a member can be popular on just one of them
+                members = await self.redis.zrevrange(
+                    key, 0, count * 2 - 1, withscores=True
+                )
+                for member, score in members:
+                    if isinstance(member, bytes):
+                        member = member.decode()
+                    totals[member] += score
+        except Exception:
+            logger.warning(f"Could not read {kind} access stats", exc_info=True)
+        return [member for member, _ in totals.most_common(count)]
+
+    async def acquire_warmup_lock(self) -> bool:
+        if self.redis is None:
+            return True
+        try:
+            return bool(
+                await self.redis.set(
+                    CACHE_WARMUP_LOCK_KEY, "1", nx=True, ex=WARMUP_LOCK_TTL
+                )
+            )
+        except Exception:
+            logger.warning("Could not get cache warm up lock", exc_info=True)
+            return True
+
+    async def warm_up(self):
+        # Nothing awaits the task, an exception would only show up when it is garbage collected
+        try:
+            await self.warm_up_cache()
+        except Exception:
+            logger.exception("Could not warm up the cache")
+
+    async def warm_up_cache(self):
+        if not await self.acquire_warmup_lock():
+            logger.info("Another worker is warming up the cache")
+            return
+
+        started_at = time.monotonic()
+        semaphore = asyncio.Semaphore(settings.CACHE_WARMUP_CONCURRENCY)
+        # Influence endpoints need a user, any valid token works for them
+        user_token = obtain_jwt(
+            {"id": 0, "username": "cache-warmer"},
+            expires_delta=timedelta(seconds=WARMUP_LOCK_TTL),
+        )
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.app),
+            base_url="http://cache-warmer",
+            headers={CACHE_WARMUP_HEADER: "1"},
+            cookies={"user_token": user_token},
+            timeout=WARMUP_REQUEST_TIMEOUT,
+        ) as client:
+            queries = list(settings.CACHE_WARMUP_LEADERBOARDS)
+            queries += await self.most_accessed(
+                LEADERBOARD_ACCESS, settings.CACHE_WARMUP_LEADERBOARD_COUNT
+            )
+            queries = list(dict.fromkeys(queries))
+            leaderboards = await asyncio.gather(
+                *(
+                    self.warm(client, semaphore, f"/leaderboard?{query}")
+                    for query in queries
+                )
+            )
+
+            user_ids = await self.profile_user_ids(leaderboards)
+            await asyncio.gather(
+                *(
+                    self.warm(client, semaphore, path)
+                    for user_id in user_ids
+                    for path in profile_paths(user_id)
+                )
+            )
+
+        logger.info(
+            f"Warmed up {len(queries)} leaderboards and {len(user_ids)} profiles "
+            f"in {time.monotonic() - started_at:.1f}s"
+        )
+
+    async def profile_user_ids(
+        self, leaderboards: list[Optional[httpx.Response]]
+    ) -> list[int]:
+        user_ids = [
+            int(user_id)
+            for user_id in await self.most_accessed(
+                PROFILE_ACCESS, settings.CACHE_WARMUP_PROFILE_COUNT
+            )
+        ]
+        for response in leaderboards:
+            if response is not None and response.status_code == 200:
+                user_ids += [user["id"] for user in response.json()["data"]]
+        user_ids = list(dict.fromkeys(user_ids))[: settings.CACHE_WARMUP_PROFILE_COUNT]
+        return list(dict.fromkeys([*settings.CACHE_WARMUP_USER_IDS, *user_ids]))
+
+    async def warm(
+        self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, path: str
+    ) -> Optional[httpx.Response]:
+        """Requests the path, a cold entry is computed and cached, a warm one is a cheap hit."""
+        async with semaphore:
+            try:
+                response = await client.get(path)
+            except Exception:
+                logger.warning(f"Could not warm up {path}", exc_info=True)
+                return None
+        if response.status_code != 200:
+            logger.warning(f"Could not warm up {path}: {response.status_code}")
+        return response
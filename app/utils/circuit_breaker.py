@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import math
+import time
+from enum import Enum
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_ERRORS = (502, 503, 504)
+
+
+class CircuitState(Enum):
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitOpenError(HTTPException):
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"{name} is unavailable, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class CircuitBreaker:
+    """
+    Fails fast while an upstream is unhealthy instead of waiting for every call to time out.
+
+    Opens after `failure_threshold` consecutive failures. After `recovery_time` seconds
+    `half_open_max_calls` probe calls are let through, a successful probe closes the circuit
+    and a failed one opens it again. Only gateway errors (502, 503, 504) and non HTTP
+    exceptions count as failures, other HTTPExceptions mean the upstream did answer.
+
+    Usage:
+        async with breaker:
+            await do_request()
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_time: float = 30,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+
+    def retry_after(self) -> int:
+        remaining = self.opened_at + self.recovery_time - time.monotonic()
+        return max(math.ceil(remaining), 1)
+
+    def before_call(self):
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_time:
+                raise CircuitOpenError(self.name, self.retry_after())
+            logger.info(f"Circuit {self.name} is half open, probing upstream")
+            self.state = CircuitState.HALF_OPEN
+            self.half_open_calls = 0
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                raise CircuitOpenError(self.name, 1)
+            self.half_open_calls += 1
+
+    def record_success(self):
+        if self.state != CircuitState.CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if (
+            self.state == CircuitState.HALF_OPEN
+            or self.failures >= self.failure_threshold
+        ):
+            if self.state != CircuitState.OPEN:
+                logger.warning(
+                    f"Circuit {self.name} opened after {self.failures} failures"
+                )
+            self.state = CircuitState.OPEN
+            self.opened_at = time.monotonic()
+
+    async def __aenter__(self):
+        self.before_call()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if isinstance(exc, asyncio.CancelledError):
+            # Caller went away, says nothing about the upstream
+            if self.state == CircuitState.HALF_OPEN:
+                self.half_open_calls -= 1
+        elif exc is None or (
+            isinstance(exc, HTTPException) and exc.status_code not in GATEWAY_ERRORS
+        ):
+            self.record_success()
+        else:
+            self.record_failure()
+        return False
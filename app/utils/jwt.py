@@ -1,10 +1,15 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import timedelta, datetime
 from typing import Annotated, Optional
 
-from fastapi import Cookie
+from fastapi import Cookie, Depends, HTTPException
 from jose import jwt
 
 from app.config import settings
+from app.db.instance import get_redis
+from app.utils.session import get_session, is_session_id
 
 JWT_EXPIRE_DAYS = 365
 SECRET_KEY = settings.JWT_SECRET_KEY
@@ -27,7 +32,89 @@ def decode_jwt(jwt_token: str):
     return user_data_dict
 
 
-def decode_user_token(
+@dataclass
+class VerifiedTokenCacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class VerifiedTokenCache:
+    """
+    LRU of tokens whose signature was already verified, to their claims.
+    Entries are dropped once the token expires, so cached tokens are never accepted past `exp`.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # token -> (expires at, claims)
+        self.entries: OrderedDict[str, tuple[Optional[float], dict]] = OrderedDict()
+        self.stats = VerifiedTokenCacheStats()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self.entries.get(token)
+        if entry is not None:
+            expires_at, claims = entry
+            if expires_at is None or expires_at > time.time():
+                self.entries.move_to_end(token)
+                self.stats.hits += 1
+                return claims
+            del self.entries[token]
+
+        self.stats.misses += 1
+        return None
+
+    def pop(self, token: str):
+        self.entries.pop(token, None)
+
+    def set(self, token: str, claims: dict, expires_at: Optional[float] = None):
+        if expires_at is None:
+            expires_at = claims.get("exp")
+        self.entries[token] = (expires_at, claims)
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+verified_tokens = VerifiedTokenCache(settings.JWT_CACHE_SIZE)
+
+
+async def decode_user_token(
     user_token: Annotated[str, Cookie()],
 ):
-    return decode_jwt(user_token)
+    """
+    Auth dependency, returns the claims of the user's session or token or raises 401.
+    Sessions are kept for SESSION_LOCAL_TTL seconds, so logouts on other workers take that long to apply.
+    """
+    claims = verified_tokens.get(user_token)
+    if claims is None and is_session_id(user_token):
+        redis = get_redis()
+        session = await get_session(redis, user_token) if redis is not None else None
+        if session is None:
+            raise HTTPException(status_code=401, detail="Session expired")
+        claims = session.claims()
+        verified_tokens.set(
+            user_token, claims, expires_at=time.time() + settings.SESSION_LOCAL_TTL
+        )
+    elif claims is None:
+        try:
+            claims = decode_jwt(user_token)
+        except Exception as ex:
+            raise HTTPException(status_code=401, detail=f"Invalid token {ex}")
+        verified_tokens.set(user_token, claims)
+    # Copy, so endpoints can't change the cached claims
+    return claims.copy()
+
+
+async def require_admin(user: Annotated[dict, Depends(decode_user_token)]):
+    """Auth dependency for endpoints only ADMIN_USER_IDS can use, raises 403 for everyone else."""
+    if user.get("id") not in settings.ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Only admins can do this")
+    return user
@@ -0,0 +1,152 @@
+import re
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import REGISTRY
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cached endpoint calls by result (hit, miss, stale, bypass)",
+    ["namespace", "result"],
+)
+CACHE_BACKEND_SECONDS = Histogram(
+    "cache_backend_seconds",
+    "Time spent reading from and writing to the cache backend",
+    ["namespace", "operation"],
+)
+
+OSU_API_REQUESTS = Counter(
+    "osu_api_requests_total",
+    "Requests to the osu! API by endpoint and status",
+    ["endpoint", "status"],
+)
+OSU_API_SECONDS = Histogram(
+    "osu_api_request_seconds",
+    "Latency of requests to the osu! API",
+    ["endpoint"],
+)
+
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_seconds",
+    "Latency of MongoDB commands by the route that ran them",
+    ["command", "collection", "route"],
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total",
+    "Failed MongoDB commands",
+    ["command", "collection", "route"],
+)
+MONGO_REQUEST_COMMANDS = Histogram(
+    "mongo_request_commands",
+    "MongoDB commands run by a single HTTP request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+
+WEBSOCKET_CONNECTIONS = Gauge(
+    "activity_websocket_connections",
+    "Connected activity websocket clients",
+    # Summed over the live workers, dead ones don't linger as their own series
+    multiprocess_mode="livesum",
+)
+ACTIVITY_BROADCAST_SECONDS = Histogram(
+    "activity_broadcast_seconds",
+    "Time spent queueing an activity for every matching websocket client",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+
+RATE_LIMITED_REQUESTS = Counter(
+    "rate_limited_requests_total",
+    "Requests answered with 429 by route class",
+    ["limit"],
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "Latency of HTTP requests by route",
+    ["method", "route", "status"],
+)
+
+NUMERIC_PATH_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def osu_api_endpoint(url: str) -> str:
+    """Path of an osu! API url with ids replaced, so every user or beatmap isn't a new label."""
+    path = url.split("://", 1)[-1]
+    path = path[path.find("/") :].split("?", 1)[0]
+    return NUMERIC_PATH_SEGMENT.sub("/{id}", path)
+
+
+class RouteLatencyMiddleware:
+    """Observes the latency of every HTTP request, labelled with the route template instead of the path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router puts the matched route in the scope
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status),
+            ).observe(time.perf_counter() - start)
+
+
+class StatsCollector:
+    """Exports the stats the app already keeps for its own endpoints."""
+
+    def families(self):
+        return (
+            CounterMetricFamily(
+                "cache_saved_cpu_seconds",
+                "Estimated serialization time saved by cache hits",
+                labels=["endpoint"],
+            ),
+            CounterMetricFamily(
+                "verified_token_cache_requests",
+                "Lookups of the verified auth token cache",
+                labels=["result"],
+            ),
+            GaugeMetricFamily(
+                "verified_token_cache_size",
+                "Tokens in the verified auth token cache",
+            ),
+        )
+
+    def describe(self):
+        # Without this the registry calls collect on registration, before the stats can be imported
+        return self.families()
+
+    def collect(self):
+        from app.utils.cache import cache_stats
+        from app.utils.jwt import verified_tokens
+
+        saved, tokens, size = self.families()
+        for endpoint, stats in cache_stats.items():
+            saved.add_metric([endpoint], stats.saved_cpu_seconds)
+        tokens.add_metric(["hit"], verified_tokens.stats.hits)
+        tokens.add_metric(["miss"], verified_tokens.stats.misses)
+        size.add_metric([], len(verified_tokens))
+        return saved, tokens, size
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
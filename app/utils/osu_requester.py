@@ -1,11 +1,15 @@
 import asyncio
+import json
 import logging
 import os
+import time
 import aiohttp
 from fastapi import HTTPException
 from Crypto.Hash import SHA256
 
 from app.config import settings
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.metrics import OSU_API_REQUESTS, OSU_API_SECONDS, osu_api_endpoint
 
 
 logger = logging.getLogger(__name__)
@@ -20,6 +24,9 @@ async def check_response(response: aiohttp.ClientResponse):
         logger.error(
             f"Error while fetching data from osu! API: {response.status}: {await response.text()}"
         )
+        if response.status >= 500 or response.status == 429:
+            # osu! itself is struggling, let the circuit breaker know
+            raise HTTPException(status_code=502)
         raise HTTPException(status_code=500)
 
 
@@ -40,7 +47,15 @@ class Requester:
                     # This might fix the random api errors we get.
                     # If doesn't work, just revert it to default by removing the connector.
                     conn = aiohttp.TCPConnector(limit=10)
-                    cls._instance.session = aiohttp.ClientSession(connector=conn)
+                    timeout = aiohttp.ClientTimeout(total=settings.OSU_API_TIMEOUT)
+                    cls._instance.session = aiohttp.ClientSession(
+                        connector=conn, timeout=timeout
+                    )
+                    cls._instance.circuit_breaker = CircuitBreaker(
+                        "osu! API",
+                        failure_threshold=settings.OSU_API_CIRCUIT_FAILURE_THRESHOLD,
+                        recovery_time=settings.OSU_API_CIRCUIT_RECOVERY_TIME,
+                    )
         return cls._instance
 
     def set_test_path(self, test_path: str):
@@ -53,11 +68,27 @@ class Requester:
     async def inner_request(
         self, method: str, url: str, headers: dict[str, str] = None, json: dict = None
     ):
-        async with self.session.request(
-            method, url, headers=headers, json=json
-        ) as response:
-            await check_response(response)
-            return await response.text()
+        endpoint = osu_api_endpoint(url)
+        status = "error"
+        start = time.perf_counter()
+        async with self.circuit_breaker:
+            try:
+                async with self.session.request(
+                    method, url, headers=headers, json=json
+                ) as response:
+                    status = str(response.status)
+                    await check_response(response)
+                    return await response.text()
+            except asyncio.TimeoutError:
+                status = "timeout"
+                logger.error(f"Timed out while fetching data from osu! API: {url}")
+                raise HTTPException(status_code=504)
+            except aiohttp.ClientError as ex:
+                logger.error(f"Could not reach osu! API: {ex}")
+                raise HTTPException(status_code=502)
+            finally:
+                OSU_API_REQUESTS.labels(endpoint, status).inc()
+                OSU_API_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
 
     async def request(
         self,
@@ -74,6 +105,9 @@ class Requester:
         """
 
         if self.test_path is None:
+            if headers is None:
+                token_manager = await OsuTokenManager.get_instance()
+                headers = await token_manager.as_header()
             text = await self.inner_request(method, url, headers, json)
             return type.model_validate_json(text)
 
@@ -84,46 +118,124 @@ class Requester:
                 existing_data = type.model_validate_json(json_file.read())
             return existing_data
         else:
-            authenticator = await LazyTestAuthenticator.get_instance()
+            token_manager = await OsuTokenManager.get_instance()
             text = await self.inner_request(
-                method, url, authenticator.as_header(), json
+                method, url, await token_manager.as_header(), json
             )
             with open(file_path, "w", encoding="utf-8") as json_file:
                 json_file.write(text)
                 return type.model_validate_json(text)
 
 
-class LazyTestAuthenticator:
+class OsuTokenManager:
+    """
+    Client credentials token of the application itself.
+    Used for public osu! data and background work, so those don't depend on user sessions.
+    The token is refreshed in the background before it expires.
+    """
+
     _instance = None
     _lock = asyncio.Lock()
 
+    # Refresh this many seconds before the token expires
+    REFRESH_MARGIN = 5 * 60
+
     @classmethod
     async def get_instance(cls):
+        """To be able to use asyncio lock"""
         if cls._instance is None:
             async with cls._lock:
                 if cls._instance is None:  # Double-check locking
-                    cls._instance = LazyTestAuthenticator()
-                    token_json = await get_osu_credentials_grant_token()
-                    cls._instance.access_token = token_json["access_token"]
+                    cls._instance = OsuTokenManager()
+                    cls._instance.access_token = None
+                    cls._instance.expires_at = 0.0
+                    cls._instance.refresh_lock = asyncio.Lock()
+                    cls._instance.refresh_task = None
         return cls._instance
 
-    def as_header(self):
-        return {"Authorization": f"Bearer {self.access_token}"}
+    def needs_refresh(self) -> bool:
+        return (
+            self.access_token is None
+            or time.monotonic() >= self.expires_at - self.REFRESH_MARGIN
+        )
+
+    def is_expired(self) -> bool:
+        return self.access_token is None or time.monotonic() >= self.expires_at
+
+    async def refresh(self):
+        async with self.refresh_lock:
+            if not self.needs_refresh():
+                return
+            token_json = await get_osu_credentials_grant_token()
+            self.access_token = token_json["access_token"]
+            self.expires_at = time.monotonic() + token_json["expires_in"]
+            logger.info(
+                f"Obtained osu! client credentials token, expires in {token_json['expires_in']}s"
+            )
+
+    async def get_token(self) -> str:
+        if self.needs_refresh():
+            try:
+                await self.refresh()
+            except Exception:
+                if self.is_expired():
+                    raise
+                # The current token works until it expires, osu! may be back by then
+                logger.warning(
+                    "Could not refresh osu! client credentials token, using the current one",
+                    exc_info=True,
+                )
+        return self.access_token
+
+    async def as_header(self):
+        return {"Authorization": f"Bearer {await self.get_token()}"}
+
+    def start(self):
+        self.refresh_task = asyncio.create_task(self.keep_fresh())
+
+    async def close(self):
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+            try:
+                await self.refresh_task
+            except asyncio.CancelledError:
+                pass
+        OsuTokenManager._instance = None
+
+    async def keep_fresh(self):
+        """Refreshes the token ahead of time so requests never wait for it."""
+        retry_delay = 1
+        while True:
+            try:
+                await self.refresh()
+                retry_delay = 1
+                refresh_at = self.expires_at - self.REFRESH_MARGIN
+                await asyncio.sleep(max(refresh_at - time.monotonic(), 1))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error(
+                    "Could not obtain osu! client credentials token", exc_info=True
+                )
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
 
 
 async def get_osu_credentials_grant_token():
-    token_url = "https://osu.ppy.sh/oauth/token"
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            token_url,
-            json={
-                "client_id": settings.OSU_CLIENT_ID,
-                "client_secret": settings.OSU_CLIENT_SECRET,
-                "grant_type": "client_credentials",
-                "scope": "identify public",
-            },
-        ) as response:
-            return await response.json()
+    """Goes through the shared session, so it has the osu! API timeout and circuit breaker."""
+    token_url = f"{settings.OSU_BASE_URL}/oauth/token"
+    requester = await Requester.get_instance()
+    text = await requester.inner_request(
+        "POST",
+        token_url,
+        json={
+            "client_id": settings.OSU_CLIENT_ID,
+            "client_secret": settings.OSU_CLIENT_SECRET,
+            "grant_type": "client_credentials",
+            "scope": "identify public",
+        },
+    )
+    return json.loads(text)
 
 
 def hash_url(url: str):
@@ -0,0 +1,214 @@
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from app.config import settings
+from app.utils.jwt import decode_user_token
+
+logger = logging.getLogger(__name__)
+
+PROFILE_REQUEST_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Allocations of the profiler itself would show up on top of every snapshot
+TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+@dataclass
+class RequestProfile:
+    id: str
+    method: str
+    path: str
+    created_at: datetime
+    duration: float
+    # marshalled pstats, same format as cProfile.Profile.dump_stats
+    stats: bytes
+
+    def summary(self, sort: str, limit: int) -> str:
+        stream = io.StringIO()
+        profile_stats = pstats.Stats(stream=stream)
+        profile_stats.stats = marshal.loads(self.stats)
+        profile_stats.get_top_level_stats()
+        profile_stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+class Profiler:
+    """
+    Runtime switches and results of the opt-in profilers, per worker.
+
+    - tracemalloc snapshots, each one is also the baseline of the next diff
+    - sampling CPU profiles of the event loop thread over a time window
+    - cProfile of single requests, for admins sending the X-Profile header
+    """
+
+    def __init__(self):
+        self.profile_requests = settings.PROFILING_REQUESTS
+        self.request_profiles: OrderedDict[str, RequestProfile] = OrderedDict()
+        self.request_profile_running = False
+        self.cpu_profile_lock = threading.Lock()
+        self.memory_baseline: Optional[tracemalloc.Snapshot] = None
+
+    def start_tracemalloc(self, frames: int):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info(f"Started tracing allocations with {frames} frames")
+        self.memory_baseline = None
+
+    def stop_tracemalloc(self):
+        tracemalloc.stop()
+        self.memory_baseline = None
+        logger.info("Stopped tracing allocations")
+
+    def take_memory_snapshot(
+        self,
+    ) -> tuple[tracemalloc.Snapshot, Optional[tracemalloc.Snapshot]]:
+        """Returns the new snapshot and the previous one, the new one is the next baseline."""
+        if not tracemalloc.is_tracing():
+            raise HTTPException(status_code=409, detail="tracemalloc is not running")
+        snapshot = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_FILTERS)
+        previous, self.memory_baseline = self.memory_baseline, snapshot
+        return snapshot, previous
+
+    def memory_top(self, key_type: str, limit: int) -> list[str]:
+        snapshot, _ = self.take_memory_snapshot()
+        return [str(stat) for stat in snapshot.statistics(key_type)[:limit]]
+
+    def memory_diff(self, key_type: str, limit: int) -> list[str]:
+        snapshot, previous = self.take_memory_snapshot()
+        if previous is None:
+            raise HTTPException(
+                status_code=409,
+                detail="No snapshot to compare to yet, this one is the baseline now",
+            )
+        return [str(stat) for stat in snapshot.compare_to(previous, key_type)[:limit]]
+
+    def sample_cpu(self, thread_id: int, seconds: float, interval: float) -> str:
+        """
+        Samples the stack of the thread every interval for `seconds`.
+        Returns collapsed stacks, one "frame;frame;frame count" line per stack,
+        the input format of flamegraph.pl and speedscope.
+        """
+        if not self.cpu_profile_lock.acquire(blocking=False):
+            raise HTTPException(
+                status_code=409, detail="A CPU profile is already running"
+            )
+        try:
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[collapsed_stack(frame)] += 1
+                time.sleep(interval)
+        finally:
+            self.cpu_profile_lock.release()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def save_request_profile(self, profile: RequestProfile):
+        self.request_profiles[profile.id] = profile
+        while len(self.request_profiles) > settings.PROFILING_REQUEST_HISTORY:
+            self.request_profiles.popitem(last=False)
+
+    def get_request_profile(self, profile_id: str) -> RequestProfile:
+        profile = self.request_profiles.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return profile
+
+
+profiler = Profiler()
+
+
+def collapsed_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+async def is_admin_token(user_token: Optional[str]) -> bool:
+    if user_token is None:
+        return False
+    try:
+        user = await decode_user_token(user_token)
+    except HTTPException:
+        return False
+    return user.get("id") in settings.ADMIN_USER_IDS
+
+
+class RequestProfilerMiddleware:
+    """
+    Profiles requests of admins sending the X-Profile header with cProfile while request profiling is on.
+    The id to download the profile with is returned in the X-Profile-Id header.
+
+    cProfile sees everything the event loop runs meanwhile, other requests included,
+    so only one request is profiled at a time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.profile_requests:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        if (
+            PROFILE_REQUEST_HEADER not in request.headers
+            or not await is_admin_token(request.cookies.get("user_token"))
+            or profiler.request_profile_running
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (PROFILE_ID_HEADER.lower().encode(), profile_id.encode()),
+                ]
+            await send(message)
+
+        profiler.request_profile_running = True
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - start
+            profiler.request_profile_running = False
+            profile.create_stats()
+            profiler.save_request_profile(
+                RequestProfile(
+                    id=profile_id,
+                    method=scope["method"],
+                    path=scope["path"],
+                    created_at=datetime.now(timezone.utc),
+                    duration=duration,
+                    stats=marshal.dumps(profile.stats),
+                )
+            )
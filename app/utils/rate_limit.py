@@ -0,0 +1,130 @@
+import logging
+import math
+from dataclasses import dataclass
+from typing import Annotated, Optional
+
+from fastapi import Depends, HTTPException
+from redis.commands.core import AsyncScript
+
+from app.config import settings
+from app.db.instance import get_redis
+from app.utils.jwt import decode_user_token
+from app.utils.metrics import RATE_LIMITED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# route class, user id
+RATE_LIMIT_KEY = "rate-limit:{}:{}"
+
+# Refills the bucket for the time since the last call, then takes a token if there is one.
+# Runs atomically in redis and uses its clock, so every worker shares one bucket per user.
+# KEYS[1] bucket, ARGV capacity, tokens per second
+# Returns 1 and 0 when allowed, 0 and milliseconds until a token is available otherwise
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated_at, 0) * rate / 1000)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) * 1000 / rate)
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", now)
+-- A full bucket is the same as no bucket
+redis.call("PEXPIRE", KEYS[1], math.ceil((capacity - tokens) * 1000 / rate) + 1000)
+return {allowed, retry_after}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Token bucket of `burst` requests, refilled with `per_minute` tokens a minute."""
+
+    name: str
+    burst: int
+    per_minute: float
+
+
+class RateLimitedError(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+token_bucket_script: Optional[AsyncScript] = None
+
+
+def get_token_bucket_script(redis) -> AsyncScript:
+    """Registered once per client, later calls use EVALSHA."""
+    global token_bucket_script
+    if (
+        token_bucket_script is None
+        or token_bucket_script.registered_client is not redis
+    ):
+        token_bucket_script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+    return token_bucket_script
+
+
+async def take_token(redis, limit: RateLimit, user_id: int) -> int:
+    """Takes a token from the user's bucket, returns 0 or the seconds to wait for the next one."""
+    script = get_token_bucket_script(redis)
+    allowed, retry_after_ms = await script(
+        keys=[RATE_LIMIT_KEY.format(limit.name, user_id)],
+        args=[limit.burst, limit.per_minute / 60],
+    )
+    if allowed:
+        return 0
+    return max(math.ceil(int(retry_after_ms) / 1000), 1)
+
+
+def rate_limit(limit: RateLimit):
+    """
+    Dependency limiting how often a user can call the routes of `limit`.
+    Without redis, or when it fails, requests are let through, throttling isn't worth an outage.
+    """
+
+    async def dependency(user: Annotated[dict, Depends(decode_user_token)]):
+        redis = get_redis()
+        if not settings.RATE_LIMIT_ENABLED or redis is None:
+            return
+        try:
+            retry_after = await take_token(redis, limit, user["id"])
+        except Exception:
+            logger.warning(f"Could not check rate limit {limit.name}", exc_info=True)
+            return
+        if retry_after:
+            RATE_LIMITED_REQUESTS.labels(limit.name).inc()
+            raise RateLimitedError(retry_after)
+
+    return dependency
+
+
+# Bio, beatmaps and influence order, each write is an activity
+PROFILE_RATE_LIMIT = RateLimit(
+    "profile",
+    burst=settings.RATE_LIMIT_PROFILE_BURST,
+    per_minute=settings.RATE_LIMIT_PROFILE_PER_MINUTE,
+)
+# Adding influences also calls the osu! API
+INFLUENCE_RATE_LIMIT = RateLimit(
+    "influence",
+    burst=settings.RATE_LIMIT_INFLUENCE_BURST,
+    per_minute=settings.RATE_LIMIT_INFLUENCE_PER_MINUTE,
+)
+
+profile_rate_limit = rate_limit(PROFILE_RATE_LIMIT)
+influence_rate_limit = rate_limit(INFLUENCE_RATE_LIMIT)
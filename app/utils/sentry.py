@@ -0,0 +1,80 @@
+import random
+from datetime import datetime
+from typing import Optional, Union
+
+import sentry_sdk
+
+from app.config import settings
+
+# Scraped every few seconds, traces of them are noise
+UNTRACED_PATHS = ("/metrics",)
+# Trace statuses of server side failures, client errors are sampled like successes
+FAILED_TRACE_STATUSES = {
+    "aborted",
+    "data_loss",
+    "deadline_exceeded",
+    "internal_error",
+    "unavailable",
+    "unimplemented",
+    "unknown",
+    "unknown_error",
+}
+
+
+def traces_sampler(sampling_context: dict) -> float:
+    """
+    Starts a transaction for every request, whether it is slow or fails is only known at the end,
+    before_send_transaction decides which ones are sent.
+    """
+    parent_sampled = sampling_context.get("parent_sampled")
+    if parent_sampled is not None:
+        return float(parent_sampled)
+
+    asgi_scope = sampling_context.get("asgi_scope") or {}
+    if (
+        asgi_scope.get("type") == "websocket"
+        or asgi_scope.get("path") in UNTRACED_PATHS
+    ):
+        return 0
+    return 1
+
+
+def timestamp_seconds(timestamp: Union[datetime, float, str, None]) -> Optional[float]:
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+    return timestamp
+
+
+def transaction_duration(event: dict) -> Optional[float]:
+    start = timestamp_seconds(event.get("start_timestamp"))
+    end = timestamp_seconds(event.get("timestamp"))
+    if start is None or end is None:
+        return None
+    return end - start
+
+
+def before_send_transaction(event: dict, hint: dict) -> Optional[dict]:
+    """Keeps every slow or failed transaction and SENTRY_TRACES_SAMPLE_RATE of the rest."""
+    status = event.get("contexts", {}).get("trace", {}).get("status")
+    if status in FAILED_TRACE_STATUSES:
+        return event
+
+    duration = transaction_duration(event)
+    if duration is not None and duration >= settings.SENTRY_SLOW_REQUEST_SECONDS:
+        return event
+
+    if random.random() < settings.SENTRY_TRACES_SAMPLE_RATE:
+        return event
+    return None
+
+
+def init_sentry():
+    sentry_sdk.init(
+        dsn=settings.SENTRY_DSN,
+        traces_sampler=traces_sampler,
+        before_send_transaction=before_send_transaction,
+        # Relative to the started transactions, which is every request
+        profiles_sample_rate=settings.SENTRY_PROFILES_SAMPLE_RATE,
+    )
@@ -0,0 +1,50 @@
+import secrets
+from typing import Optional
+
+from pydantic import BaseModel
+from redis import asyncio as aioredis
+
+from app.config import settings
+
+# Cookies starting with this hold a session id, anything else is a legacy JWT
+SESSION_ID_PREFIX = "s:"
+SESSION_KEY = "session:{}"
+
+
+class Session(BaseModel):
+    """
+    The logged in user. osu! API calls use the app's client credentials token,
+    so the user's osu! token is not kept.
+    """
+
+    user: dict
+
+    def claims(self) -> dict:
+        """Same shape as the user JWT, so endpoints don't care where the user came from."""
+        return dict(self.user)
+
+
+def is_session_id(user_token: str) -> bool:
+    return user_token.startswith(SESSION_ID_PREFIX)
+
+
+async def create_session(redis: aioredis.Redis, user: dict) -> str:
+    session_id = SESSION_ID_PREFIX + secrets.token_urlsafe(32)
+    session = Session(user=user)
+    await redis.set(
+        SESSION_KEY.format(session_id),
+        session.model_dump_json(),
+        ex=settings.SESSION_TTL,
+    )
+    return session_id
+
+
+async def get_session(redis: aioredis.Redis, session_id: str) -> Optional[Session]:
+    data = await redis.get(SESSION_KEY.format(session_id))
+    if data is None:
+        return None
+    return Session.model_validate_json(data)
+
+
+async def delete_session(redis: aioredis.Redis, session_id: str):
+    await redis.delete(SESSION_KEY.format(session_id))